@@ -0,0 +1,242 @@
+from tools.scheduler import generate_schedule, MODES
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+# Grid of (players, games per player); every cell runs in both modes
+PLAYER_COUNTS = [4, 8, 13, 16, 24, 32, 48, 64]
+GAMES_PER_PLAYER = [1, 2, 4, 7, 10]
+QUICK_PLAYER_COUNTS = [4, 13, 24]
+QUICK_GAMES_PER_PLAYER = [1, 4, 10]
+
+# Each cell runs once per seed at a fixed restart budget, so penalties are
+# reproducible. Templates are off so every size exercises the search itself.
+SEEDS = [1, 2, 3]
+ITERATIONS = 50
+
+# The production path: unseeded, default restarts, templates on. These sizes
+# have no template, so the default search runs.
+DEFAULT_PATH_CELLS = [(13, 4), (28, 5), (40, 6)]
+QUICK_DEFAULT_PATH_CELLS = [(13, 4)]
+DEFAULT_PATH_RUNS = 3
+
+# Allowed drift before a cell counts as a regression
+LATENCY_TOLERANCE = 0.5       # p50 may be up to 50% slower...
+LATENCY_SLACK_MS = 25.0       # ...plus this much, so tiny cells don't flap
+MEMORY_TOLERANCE = 0.5
+MEMORY_SLACK_KB = 256.0
+PENALTY_TOLERANCE = 0.01      # mean penalty may be up to 1% worse
+DEFAULT_PATH_PENALTY_TOLERANCE = 0.03 # unseeded runs vary, so allow more
+
+# Fixed pure-Python workload timed in the same process as the grid. Latency
+# limits scale by how fast this ran compared with the baseline run.
+CALIBRATION_LOOPS = 200000
+CALIBRATION_RUNS = 5
+
+def make_players(player_count):
+    """Same roster for a given size on every run."""
+    rng = random.Random(player_count)
+    return [{"id": f"p{i}", "hiddenRating": round(rng.gauss(35.0, 6.0), 2)} for i in range(player_count)]
+
+def partner_repeats(matches):
+    pairs = Counter(frozenset(team) for m in matches for team in (m["team1"], m["team2"]))
+    return sum(count - 1 for count in pairs.values())
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def calibrate():
+    """Best-of-N time (ms) of a fixed loop of the scheduler's kind of work."""
+    best = None
+    for _ in range(CALIBRATION_RUNS):
+        rng = random.Random(0)
+        counts = {}
+        start_time = time.perf_counter()
+        for i in range(CALIBRATION_LOOPS):
+            key = (i % 97, rng.randrange(64))
+            counts[key] = counts.get(key, 0) + 1
+        elapsed = (time.perf_counter() - start_time) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+def run_cell(player_count, games_per_player, mode, default_path=False):
+    """
+    Seeded search cells run ITERATIONS restarts once per seed with templates
+    off; default-path cells make DEFAULT_PATH_RUNS plain production calls.
+    """
+    players = make_players(player_count)
+    if default_path:
+        options = [{}] * DEFAULT_PATH_RUNS
+    else:
+        options = [{"iterations": ITERATIONS, "seed": seed, "use_templates": False} for seed in SEEDS]
+    latencies = []
+    penalties = []
+    repeats = []
+    iterations = 0
+
+    for kwargs in options:
+        start_time = time.perf_counter()
+        result = generate_schedule(players, games_per_player, mode, **kwargs)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        penalties.append(result.penalty)
+        repeats.append(partner_repeats(result.matches))
+        iterations += result.iterations
+
+    # Separate pass for memory; tracemalloc slows everything down
+    tracemalloc.start()
+    generate_schedule(players, games_per_player, mode, **options[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50Ms": round(percentile(latencies, 50), 2),
+        "p90Ms": round(percentile(latencies, 90), 2),
+        "maxMs": round(max(latencies), 2),
+        "iterationsPerSec": round(iterations / (sum(latencies) / 1000.0), 1),
+        "peakMemoryKb": round(peak / 1024.0, 1),
+        "penalty": round(sum(penalties) / len(penalties), 3),
+        "partnerRepeats": max(repeats)
+    }
+
+def cell_key(player_count, games_per_player, mode, default_path=False):
+    return f"{mode}/{player_count}x{games_per_player}" + ("/default" if default_path else "")
+
+def compare(key, current, baseline, latency_scale=1.0):
+    """
+    Returns a list of regression messages for one cell. The baseline p50 is
+    multiplied by `latency_scale` (this machine's speed relative to the
+    baseline run); None skips the latency check.
+    """
+    problems = []
+    if latency_scale is not None:
+        expected = baseline["p50Ms"] * latency_scale
+        limit = expected * (1 + LATENCY_TOLERANCE) + LATENCY_SLACK_MS
+        if current["p50Ms"] > limit:
+            problems.append(f"{key}: p50 {current['p50Ms']:.1f}ms > {limit:.1f}ms "
+                            f"(baseline {baseline['p50Ms']:.1f}ms, scaled {expected:.1f}ms)")
+
+    limit = baseline["peakMemoryKb"] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_KB
+    if current["peakMemoryKb"] > limit:
+        problems.append(f"{key}: peak memory {current['peakMemoryKb']:.0f}KB > {limit:.0f}KB")
+
+    tolerance = DEFAULT_PATH_PENALTY_TOLERANCE if key.endswith("/default") else PENALTY_TOLERANCE
+    limit = baseline["penalty"] + abs(baseline["penalty"]) * tolerance
+    if current["penalty"] > limit:
+        problems.append(f"{key}: penalty {current['penalty']:.0f} > {limit:.0f} (baseline {baseline['penalty']:.0f})")
+
+    if current["partnerRepeats"] > baseline["partnerRepeats"]:
+        problems.append(f"{key}: partner repeats {current['partnerRepeats']} > {baseline['partnerRepeats']}")
+    return problems
+
+def latency_scale(calibration_ms, baseline):
+    """
+    How much slower than the baseline run this process is, or None (with the
+    reason) when latencies can't be compared: a different CPU architecture
+    or Python version changes the mix too much for one loop to correct.
+    """
+    here = (platform.machine(), platform.python_version())
+    there = (baseline.get("machine"), baseline.get("python"))
+    if here != there:
+        return None, f"baseline is {there[0]}/Python {there[1]}, this is {here[0]}/Python {here[1]}"
+    if not baseline.get("calibrationMs"):
+        return 1.0, "baseline has no calibration; comparing raw latencies"
+    scale = calibration_ms / baseline["calibrationMs"]
+    return scale, f"calibration {calibration_ms:.1f}ms vs {baseline['calibrationMs']:.1f}ms; latency limits x{scale:.2f}"
+
+def run(quick=False):
+    player_counts = QUICK_PLAYER_COUNTS if quick else PLAYER_COUNTS
+    games_options = QUICK_GAMES_PER_PLAYER if quick else GAMES_PER_PLAYER
+    default_cells = QUICK_DEFAULT_PATH_CELLS if quick else DEFAULT_PATH_CELLS
+
+    grid = [(player_count, games_per_player, False) for player_count in player_counts for games_per_player in games_options]
+    grid += [(player_count, games_per_player, True) for player_count, games_per_player in default_cells]
+
+    results = {}
+    print(f"{'cell':<34} {'p50ms':>9} {'p90ms':>9} {'it/s':>9} {'peakKB':>9} {'penalty':>12} {'rep':>4}")
+    for mode in MODES:
+        for player_count, games_per_player, default_path in grid:
+            key = cell_key(player_count, games_per_player, mode, default_path)
+            cell = run_cell(player_count, games_per_player, mode, default_path)
+            results[key] = cell
+            print(f"{key:<34} {cell['p50Ms']:>9.1f} {cell['p90Ms']:>9.1f} {cell['iterationsPerSec']:>9.0f} "
+                  f"{cell['peakMemoryKb']:>9.0f} {cell['penalty']:>12.0f} {cell['partnerRepeats']:>4}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler benchmark and quality-regression check.")
+    parser.add_argument("--quick", action="store_true", help="run a small subset of the grid")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+
+    calibration_ms = calibrate()
+    results = run(quick=args.quick)
+    # Again afterwards, in case the machine got busier or quieter during the grid
+    calibration_ms = min(calibration_ms, calibrate())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cells": results}, f, indent=1, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "calibrationMs": calibration_ms,
+                "iterations": ITERATIONS,
+                "seeds": SEEDS,
+                "defaultPathRuns": DEFAULT_PATH_RUNS,
+                "cells": results
+            }, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"\nWrote baseline for {len(results)} cells to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline first.")
+        return 1
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    scale, note = latency_scale(calibration_ms, baseline)
+    if scale is None:
+        print(f"\nSkipping latency checks: {note}.")
+    else:
+        print(f"\nLatency: {note}.")
+
+    problems = []
+    missing = 0
+    for key, cell in results.items():
+        if key not in baseline["cells"]:
+            missing += 1
+            continue
+        problems.extend(compare(key, cell, baseline["cells"][key], scale))
+
+    if missing:
+        print(f"\n{missing} cells have no baseline entry and were not compared.")
+    if problems:
+        print("\n❌ REGRESSIONS:")
+        for p in problems:
+            print(f"  - {p}")
+        return 1
+
+    print(f"\n✅ No regressions across {len(results) - missing} cells.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from tools.scheduler import Scheduler, TEMPLATES_PATH
+import json
+import time
+
+# Roster sizes we see every week; all divisible by 4 so every round is full
+PLAYER_COUNTS = [8, 12, 16, 20, 24]
+MAX_GAMES_PER_PLAYER = 10
+SEEDS = [1, 2, 3]
+
+def is_valid_template(matches, player_count, games_per_player):
+    """Full rounds, everyone plays every round, no partner pair twice."""
+    per_round = player_count // 4
+    if len(matches) != per_round * games_per_player:
+        return False
+
+    for start in range(0, len(matches), per_round):
+        seated = [p for m in matches[start:start + per_round] for p in m]
+        if sorted(seated) != list(range(player_count)):
+            return False
+
+    partners = set()
+    for a, b, c, d in matches:
+        for pair in (frozenset((a, b)), frozenset((c, d))):
+            if pair in partners:
+                return False
+            partners.add(pair)
+    return True
+
+def build_template(player_count, games_per_player):
+    # Equal ratings, so only the mixing structure is optimized
+    players = [{"id": str(i), "hiddenRating": 35.0} for i in range(player_count)]
+
+    best = None
+    for seed in SEEDS:
+        scheduler = Scheduler(players, games_per_player, "STRICT_SOCIAL", seed=seed)
+        scheduler.USE_TEMPLATES = False
+        result = scheduler.search()
+        matches = [[int(pid) for pid in m["team1"] + m["team2"]] for m in result.matches]
+
+        if not is_valid_template(matches, player_count, games_per_player):
+            continue
+        if best is None or result.penalty < best["penalty"]:
+            best = {"matches": matches, "penalty": result.penalty, "provenOptimal": result.proven_optimal}
+        if result.proven_optimal:
+            break
+
+    return best
+
+def build():
+    templates = {}
+    for player_count in PLAYER_COUNTS:
+        for games_per_player in range(1, min(MAX_GAMES_PER_PLAYER, player_count - 1) + 1):
+            start_time = time.time()
+            template = build_template(player_count, games_per_player)
+            elapsed = time.time() - start_time
+
+            key = f"{player_count}x{games_per_player}"
+            if template is None:
+                print(f"  {key}: no valid template found ({elapsed:.1f}s)")
+                continue
+
+            templates[key] = template
+            status = "optimal" if template["provenOptimal"] else "best found"
+            print(f"  {key}: penalty {template['penalty']:.0f} ({status}, {elapsed:.1f}s)")
+
+    with open(TEMPLATES_PATH, "w") as f:
+        json.dump({"version": 1, "templates": templates}, f, separators=(",", ":"))
+        f.write("\n")
+
+    print(f"Wrote {len(templates)} templates to {TEMPLATES_PATH}")
+
+if __name__ == "__main__":
+    build()
@@ -5,27 +5,149 @@ initialize_app()
 
 # Import tools to register Cloud Functions
 from tools.communication_hub import sync_session_channel, sync_club_channel
-from tools import scheduler
+from tools.schedule_drafts import precompute_schedule_draft
+from tools import scheduler, schedule_cache, schedule_drafts, oddsmaker, sessions
+
+MAX_SCHEDULE_ITERATIONS = 20000
+# Rosters this large are scheduled as rating pods (see scheduler.generate_large_event)
+LARGE_EVENT_PLAYERS = 64
+
+# Warm instances reuse recent schedules; Firestore backs the LRU across instances
+_schedule_cache = schedule_cache.ScheduleCache(max_entries=256, store=schedule_cache.FirestoreScheduleStore())
 
 @https_fn.on_call()
 def generate_schedule(req: https_fn.CallableRequest) -> any:
     """
     Generates a schedule for pickleball sessions.
-    Input: { players: [], gamesPerPlayer: 4, mode: "STRICT_SOCIAL" }
+    Input: { players: [{ id }], gamesPerPlayer: 4, mode: "STRICT_SOCIAL", sessionId?: "...",
+             iterations?: 500, workers?: 1, seed?: int,
+             timeBudgetMs?: number, targetPenalty?: number, useTemplates?: true,
+             reshuffle?: false, courts?: int, podSize?: int,
+             diagnostics?: false, profile?: false }
+    Output: { matches: [{ team1, team2, spread, favoriteTeam }],
+              meta: { penalty, iterations, elapsedMs, stopReason, lowerBound, provenOptimal },
+              cache: { hit, hits, persistentHits, misses, size }, draft?: true, diagnostics? }
+    Identical requests (same IDs, rating buckets, gamesPerPlayer, mode and
+    search options) are served from cache unless reshuffle is set. With
+    courts set, the plan is built round by round with at most that many
+    matches per round, and each match carries its round and court number;
+    if timeBudgetMs runs out first, the rounds built so far come back with
+    stopReason "deadline". Rosters of LARGE_EVENT_PLAYERS
+    or more (or any roster with podSize set) are split into rating pods and
+    also come back with round and court numbers. diagnostics (or profile,
+    which adds a cProfile report) skips the cache lookup so the counters
+    describe a real search. Only the player IDs are read from the request:
+    ratings come from the players' documents, and every match comes back
+    priced from them, so clients never compute spreads themselves. With
+    sessionId set, the priced matches are also saved to that session
+    (refused once it has scores), and a request with default options is
+    answered by the session's precomputed draft while its roster and
+    ratings still match (draft: true).
     """
     data = req.data
     players = data.get("players", [])
+    session_id = data.get("sessionId")
     games_per_player = data.get("gamesPerPlayer", 4)
     mode = data.get("mode", "STRICT_SOCIAL")
+    iterations = data.get("iterations")
+    workers = data.get("workers", 1)
+    seed = data.get("seed")
+    time_budget_ms = data.get("timeBudgetMs")
+    target_penalty = data.get("targetPenalty")
+    use_templates = data.get("useTemplates", True) is not False
+    reshuffle = bool(data.get("reshuffle", False))
+    courts = data.get("courts")
+    pod_size = data.get("podSize")
+    diagnostics = bool(data.get("diagnostics", False))
+    profile = bool(data.get("profile", False))
 
     # Validate input
     if not players or len(players) < 4:
         return {"error": "At least 4 players are required."}
 
-    matches = scheduler.generate_matches(players, games_per_player, mode)
-    return {"matches": matches}
+    try:
+        iterations = min(int(iterations), MAX_SCHEDULE_ITERATIONS) if iterations else None
+        workers = max(1, int(workers))
+        time_budget_ms = float(time_budget_ms) if time_budget_ms else None
+        target_penalty = float(target_penalty) if target_penalty is not None else None
+        courts = int(courts) if courts else None
+        pod_size = max(8, int(pod_size)) if pod_size else None
+    except (TypeError, ValueError):
+        return {"error": "iterations, workers, timeBudgetMs, targetPenalty, courts and podSize must be numbers."}
+
+    # Ratings come from Firestore, never from the request
+    player_ids = [p.get("id") if isinstance(p, dict) else p for p in players]
+    players = sessions.fetch_players(player_ids)
+    players_by_id = {p["id"]: p for p in players}
+    unknown = [str(pid) for pid in player_ids if pid not in players_by_id]
+    if unknown:
+        return {"error": f"Unknown players: {', '.join(unknown)}"}
+
+    # A default request for a session is answered by its draft, if still current
+    default_request = not (
+        iterations or seed is not None or time_budget_ms or target_penalty is not None or not use_templates
+        or reshuffle or courts or pod_size or diagnostics or profile
+    ) and len(players) < LARGE_EVENT_PLAYERS
+    draft = None
+    if session_id and default_request:
+        draft = schedule_drafts.get_draft(
+            session_id, mode, schedule_cache.canonical_key(players, games_per_player, mode)
+        )
+
+    if draft is not None:
+        response = {**draft, "matches": oddsmaker.apply_spreads(draft["matches"], players_by_id), "draft": True}
+    else:
+        response = _generate_priced_schedule(
+            players, players_by_id, games_per_player, mode, iterations, workers, seed, time_budget_ms,
+            target_penalty, use_templates, reshuffle, courts, pod_size, diagnostics, profile
+        )
+    if session_id:
+        saved = sessions.save_schedule(session_id, response["matches"])
+        if "error" in saved: return saved
+    return response
+
+def _generate_priced_schedule(players, players_by_id, games_per_player, mode, iterations, workers, seed,
+                              time_budget_ms, target_penalty, use_templates, reshuffle, courts, pod_size,
+                              diagnostics, profile):
+    if pod_size or len(players) >= LARGE_EVENT_PLAYERS:
+        result = scheduler.generate_large_event(
+            players, games_per_player, mode, pod_size=pod_size or scheduler.POD_SIZE,
+            workers=workers, seed=seed, time_budget_ms=time_budget_ms
+        )
+        return {"matches": oddsmaker.apply_spreads(result.matches, players_by_id), "meta": result.meta()}
 
-from tools import sessions, betting
+    if courts:
+        result = scheduler.plan_rounds(
+            players, games_per_player, mode, courts=courts, seed=seed, time_budget_ms=time_budget_ms
+        )
+        matches = oddsmaker.apply_spreads(result.matches, players_by_id)
+        return {"matches": matches, "meta": {**result.meta(), "rounds": result.iterations, "courts": courts}}
+
+    # Non-default search options get their own entries, so a seeded or
+    # low-budget result is never served to a default request
+    cache_key = schedule_cache.canonical_key(players, games_per_player, mode, {
+        "seed": seed, "iterations": iterations, "timeBudgetMs": time_budget_ms,
+        "targetPenalty": target_penalty, "useTemplates": use_templates
+    })
+    cached = None if reshuffle or diagnostics or profile else _schedule_cache.get(cache_key)
+    if cached is not None:
+        matches = oddsmaker.apply_spreads(cached["matches"], players_by_id)
+        return {**cached, "matches": matches, "cache": {"hit": True, **_schedule_cache.stats()}}
+
+    result = scheduler.generate_schedule(
+        players, games_per_player, mode,
+        iterations=iterations, workers=workers, seed=seed,
+        time_budget_ms=time_budget_ms, target_penalty=target_penalty,
+        use_templates=use_templates, diagnostics=diagnostics, profile=profile
+    )
+    _schedule_cache.put(cache_key, result.matches, result.meta())
+    matches = oddsmaker.apply_spreads(result.matches, players_by_id)
+    response = {"matches": matches, "meta": result.meta(), "cache": {"hit": False, **_schedule_cache.stats()}}
+    if result.diagnostics is not None:
+        response["diagnostics"] = result.diagnostics
+    return response
+
+from tools import betting
 
 @https_fn.on_call()
 def place_bet(req: https_fn.CallableRequest) -> any:
@@ -74,6 +196,134 @@ def substitute_player(req: https_fn.CallableRequest) -> any:
     if not all([session_id, old_pid, new_pid]): return {"error": "Missing params"}
     return sessions.substitute_player(session_id, old_pid, new_pid)
 
+@https_fn.on_call()
+def reschedule_session(req: https_fn.CallableRequest) -> any:
+    """Re-optimizes unplayed matches for the current roster. Input: { sessionId: "...", mode?: "STRICT_SOCIAL" }"""
+    session_id = req.data.get("sessionId")
+    mode = req.data.get("mode", "STRICT_SOCIAL")
+    if not session_id: return {"error": "Missing sessionId"}
+    return sessions.reschedule_session(session_id, mode)
+
+@https_fn.on_call()
+def recalculate_spreads(req: https_fn.CallableRequest) -> any:
+    """Re-prices unplayed matches from current ratings. Input: { sessionId: "..." }"""
+    session_id = req.data.get("sessionId")
+    if not session_id: return {"error": "Missing sessionId"}
+    return sessions.recalculate_spreads(session_id)
+
+@https_fn.on_call()
+def next_round(req: https_fn.CallableRequest) -> any:
+    """Schedules the next round onto free courts. Input: { sessionId: "...", courts?: 3, mode?: "STRICT_SOCIAL" }"""
+    session_id = req.data.get("sessionId")
+    courts = req.data.get("courts")
+    mode = req.data.get("mode", "STRICT_SOCIAL")
+    if not session_id: return {"error": "Missing sessionId"}
+    try:
+        courts = int(courts) if courts else None
+    except (TypeError, ValueError):
+        return {"error": "courts must be a number."}
+    return sessions.next_round(session_id, courts, mode)
+
+@https_fn.on_call()
+def court_ready(req: https_fn.CallableRequest) -> any:
+    """
+    Open play: a court just freed up, so record its score and start the next match on it.
+    Input: { sessionId: "...", court: 3, team1Score?: 11, team2Score?: 7, mode?: "STRICT_SOCIAL" }
+    """
+    session_id = req.data.get("sessionId")
+    court = req.data.get("court")
+    mode = req.data.get("mode", "STRICT_SOCIAL")
+    if not session_id or court is None: return {"error": "Missing sessionId or court"}
+    try:
+        court = int(court)
+    except (TypeError, ValueError):
+        return {"error": "court must be a number."}
+    return sessions.court_ready(session_id, court, req.data.get("team1Score"), req.data.get("team2Score"), mode)
+
+@https_fn.on_call()
+def schedule_league(req: https_fn.CallableRequest) -> any:
+    """
+    Schedules all upcoming sessions of a league with cross-week history.
+    Input: { leagueId: "...", mode?: "STRICT_SOCIAL", seedFromCompleted?: true, overwrite?: false, workers?: int }
+    """
+    league_id = req.data.get("leagueId")
+    mode = req.data.get("mode", "STRICT_SOCIAL")
+    workers = req.data.get("workers")
+    if not league_id: return {"error": "Missing leagueId"}
+    try:
+        workers = max(1, int(workers)) if workers else None
+    except (TypeError, ValueError):
+        return {"error": "workers must be a number."}
+    return sessions.schedule_league(
+        league_id, mode,
+        seed_from_completed=req.data.get("seedFromCompleted", True) is not False,
+        overwrite=bool(req.data.get("overwrite", False)),
+        workers=workers
+    )
+
+from tools import rating_history
+
+@https_fn.on_call()
+def get_rating_history(req: https_fn.CallableRequest) -> any:
+    """
+    Rating histories for charts. Input: { playerIds: [], start?: "YYYY-MM", end?: "YYYY-MM" }
+    Output: { histories: { playerId: { timestamps: [], ratings: [], matchIds: [] } } }
+    start must not be after end, and the range may span at most
+    rating_history.MAX_HISTORY_MONTHS months (end defaults to this month).
+    """
+    player_ids = req.data.get("playerIds") or []
+    start = req.data.get("start") or None
+    end = req.data.get("end") or None
+    if not player_ids: return {"error": "Missing playerIds"}
+    try:
+        rating_history.validate_range(start, end)
+    except ValueError as e:
+        return {"error": str(e)}
+    histories = rating_history.get_histories(rating_history.get_db(), player_ids, start, end)
+    return {"histories": histories}
+
+from tools import what_if
+
+_what_if_sessions = what_if.WhatIfStore()
+
+@https_fn.on_call()
+def what_if_schedule(req: https_fn.CallableRequest) -> any:
+    """
+    Re-scores hand edits to a schedule incrementally.
+    Input: { token?: "...", players?: [], matches?: [], gamesPerPlayer?: 4, mode?: "STRICT_SOCIAL",
+             edits?: [ { type: "swap", matchA, playerA, matchB, playerB }
+                     | { type: "replace", matchId, playerOut, playerIn }
+                     | { type: "move", matchId, toIndex } ] }
+    Output: { token, penalty: { skill, missedPartner, repeatPartner, missedOpponent, repeatOpponent, missingGames, total },
+              conflicts: { repeatPartners, repeatOpponents, doubleBookings } }
+    Send players and matches once to open a scoring session, then only the
+    token and edits. If the token has expired (cold instance), expired is
+    set and the client resends players and matches.
+    """
+    data = req.data
+    token = data.get("token")
+    session = _what_if_sessions.get(token)
+
+    if session is None:
+        if not data.get("matches") or not data.get("players"):
+            return {"error": "Unknown or expired token; resend players and matches.", "expired": True}
+        try:
+            session = what_if.WhatIfSession(
+                data["players"], data["matches"], data.get("gamesPerPlayer", 4), data.get("mode", "STRICT_SOCIAL")
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        token = _what_if_sessions.open(session)
+
+    for applied, edit in enumerate(data.get("edits") or []):
+        try:
+            session.apply_edit(edit)
+        except ValueError as e:
+            return {"error": str(e), "applied": applied, "token": token,
+                    "penalty": session.score(), "conflicts": session.conflicts()}
+
+    return {"token": token, "penalty": session.score(), "conflicts": session.conflicts()}
+
 from tools import admin
 
 @https_fn.on_call()
@@ -0,0 +1,62 @@
+import argparse
+import sys
+import time
+
+import firebase_admin
+from firebase_admin import firestore
+
+from tools import rating_replay
+from tools.ratings import K_FACTOR, SCALE_FACTOR, DEFAULT_RATING
+
+# Initialize with default credentials (gcloud auth or GOOGLE_APPLICATION_CREDENTIALS)
+try:
+    firebase_admin.get_app()
+except ValueError:
+    firebase_admin.initialize_app()
+
+db = firestore.client()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute every player's hiddenRating from match history.")
+    parser.add_argument("--k", type=float, default=K_FACTOR)
+    parser.add_argument("--scale", type=float, default=SCALE_FACTOR)
+    parser.add_argument("--default", type=float, default=DEFAULT_RATING)
+    parser.add_argument("--no-resume", action="store_true", help="ignore saved checkpoints and replay from zero")
+    parser.add_argument("--write", action="store_true", help="save the replayed ratings to players")
+    parser.add_argument("--top", type=int, default=20, help="how many of the biggest changes to print")
+    args = parser.parse_args()
+
+    # 1. Load History
+    start_time = time.perf_counter()
+    log = rating_replay.load_match_log(db)
+    print(f"Loaded {len(log)} scored matches for {len(log.player_ids)} players "
+          f"in {time.perf_counter() - start_time:.1f}s")
+
+    # 2. Replay
+    start_time = time.perf_counter()
+    result = rating_replay.replay(
+        log, k_factor=args.k, scale_factor=args.scale, default_rating=args.default,
+        store=rating_replay.FirestoreCheckpointStore(), resume=not args.no_resume
+    )
+    print(f"Replayed matches {result.resumed_from}-{result.match_count} in {time.perf_counter() - start_time:.2f}s "
+          f"({result.checkpoints_saved} checkpoints saved)")
+
+    # 3. Compare with Stored Ratings
+    replayed = result.ratings_by_id()
+    player_docs = db.get_all([db.collection('players').document(pid) for pid in replayed])
+    current = {d.id: float(d.to_dict().get('hiddenRating') or args.default) for d in player_docs if d.exists}
+    changes = sorted(
+        ((replayed[pid] - current[pid], pid) for pid in replayed if pid in current),
+        key=lambda item: -abs(item[0])
+    )
+    for delta, pid in changes[:args.top]:
+        print(f"  {pid:<30} {current[pid]:8.2f} -> {replayed[pid]:8.2f} ({delta:+.2f})")
+
+    # 4. Save
+    if args.write:
+        written = rating_replay.write_ratings(db, {pid: replayed[pid] for pid in current})
+        print(f"Wrote {written} ratings.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
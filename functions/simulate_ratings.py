@@ -0,0 +1,55 @@
+from tools.rating_simulation import sweep
+import argparse
+import json
+import os
+import sys
+import time
+
+def float_list(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tune the rating constants on simulated seasons (see tools/rating_simulation.py)."
+    )
+    parser.add_argument("--k", type=float_list, default=[2.0, 3.0, 4.0, 6.0], help="comma-separated K factors")
+    parser.add_argument("--scale", type=float_list, default=[30.0, 40.0, 60.0], help="comma-separated scale factors")
+    parser.add_argument("--default", type=float_list, default=[30.0, 35.0, 40.0],
+                        help="comma-separated default ratings")
+    parser.add_argument("--worlds", type=int, default=4, help="simulated clubs per parameter set")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=2000, help="sessions per simulated club")
+    parser.add_argument("--session-size", type=int, default=16)
+    parser.add_argument("--games", type=int, default=4, help="games per player per session")
+    parser.add_argument("--mode", default="STRICT_SOCIAL")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    results = sweep(
+        args.k, args.scale, args.default, worlds=args.worlds, workers=args.workers, seed=args.seed,
+        players=args.players, sessions=args.sessions, session_size=args.session_size,
+        games_per_player=args.games, mode=args.mode
+    )
+    elapsed = time.perf_counter() - start_time
+
+    print(f"{'K':>5} {'scale':>6} {'default':>7} {'brier2H':>8} {'oracle':>7} {'logLoss':>8} "
+          f"{'rmse':>6} {'rank':>5} {'steady':>6} {'conv':>5}")
+    for r in results:
+        conv = "-" if r["gamesToConverge"] is None else f"{r['gamesToConverge']:.0f}"
+        print(f"{r['kFactor']:>5g} {r['scaleFactor']:>6g} {r['defaultRating']:>7g} {r['brierSecondHalf']:>8.4f} "
+              f"{r['brierOracle']:>7.4f} {r['logLoss']:>8.4f} {r['finalRmse']:>6.2f} {r['rankCorrelation']:>5.2f} "
+              f"{r['steadyStateError']:>6.2f} {conv:>5}")
+
+    replayed = sum(r["matches"] for r in results)
+    print(f"\nReplayed {replayed:,} simulated matches over {len(results)} parameter sets in {elapsed:.0f}s.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
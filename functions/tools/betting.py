@@ -1,14 +1,23 @@
+import hashlib
+from collections import defaultdict
 from datetime import datetime
 from firebase_admin import firestore
 from google.cloud import firestore as google_firestore
+from google.api_core import exceptions as google_exceptions
+
+# Firestore allows 500 writes per batch
+SETTLEMENT_BATCH_SIZE = 500
+# Times a user's settlement is re-read and retried after a concurrent change
+SETTLEMENT_RETRIES = 3
 
 def calculate_bet_outcome(bet, team1_score, team2_score):
     """
     Pure logic to determine if a bet WON, LOST, or PUSH.
     """
     outcome = 'LOST'
-    spread = float(bet.get('spreadAtTimeOfBet', 0))
-    favorite = int(bet.get('favoriteTeamAtTimeOfBet', 0))
+    spread = float(bet.get('spreadAtTimeOfBet') or 0)
+    # Pick 'em matches store favoriteTeam as null
+    favorite = int(bet.get('favoriteTeamAtTimeOfBet') or 0)
     team_picked = int(bet.get('teamPicked', 0))
 
     score_diff = 0
@@ -115,6 +124,164 @@ def _resolve_single_bet(transaction, bet_ref, t1_score, t2_score):
     })
 
 
+def _settlement(bet, match):
+    """Bet update and wallet credit for one OPEN bet: (fields, payout)."""
+    amount = float(bet.get('amount', 0))
+    if match.get('team1Score') is None or match.get('team2Score') is None:
+        return {
+            'status': 'REFUNDED',
+            'resolvedAt': firestore.SERVER_TIMESTAMP,
+            'payout': amount,
+            'note': 'Match unplayed'
+        }, amount
+
+    t1_score, t2_score = int(match['team1Score']), int(match['team2Score'])
+    outcome = calculate_bet_outcome(bet, t1_score, t2_score)
+    payout = amount * 2 if outcome == 'WON' else amount if outcome == 'PUSH' else 0
+    return {
+        'status': outcome,
+        'resolvedAt': firestore.SERVER_TIMESTAMP,
+        'payout': payout,
+        'finalScore': f"{t1_score}-{t2_score}"
+    }, payout
+
+def wallet_mutation_key(session_id, user_id, bet_ids):
+    """Idempotency key of a settlement credit: the same bets always give the same key."""
+    payload = '|'.join([session_id, user_id] + sorted(bet_ids))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def fetch_open_bets(db, session_id):
+    """Every OPEN bet of a session (by weekId), in one query."""
+    query = db.collection('bets').where(filter=firestore.FieldFilter('weekId', '==', session_id)) \
+        .where(filter=firestore.FieldFilter('status', '==', 'OPEN'))
+    return list(query.stream())
+
+def settle_session_bets(db, session_id, matches, open_bets=None):
+    """
+    Settles every OPEN bet of a session in bulk: scored matches are
+    resolved and unplayed ones refunded. All bets come from one query (by
+    weekId), or from `open_bets` if the caller already ran it (see
+    fetch_open_bets); outcomes are computed in memory and payouts are
+    summed per user, so each user gets one wallet increment however many
+    bets they placed.
+
+    A user's increment and bet updates always share one batch, so they
+    commit together. Each bet update only applies if the bet is unchanged
+    since it was read. If another settlement got there first, the batch
+    fails, and that user's bets are re-read and settled again.
+
+    Every credit also creates users/{uid}/walletMutations/{key}, keyed by
+    wallet_mutation_key. A retry that rebuilds the same credit fails on
+    that create instead of paying twice. Returns counts, including how
+    many users could not be settled after SETTLEMENT_RETRIES (unsettled).
+    """
+    matches_by_id = {m['id']: m for m in matches if m.get('id')}
+
+    # 1. Fetch OPEN Bets (one query, unless the caller already ran it)
+    if open_bets is None:
+        open_bets = fetch_open_bets(db, session_id)
+    bets_by_user = defaultdict(list)
+    skipped = 0
+    for bet_doc in open_bets:
+        if bet_doc.to_dict().get('matchId') in matches_by_id:
+            bets_by_user[bet_doc.to_dict().get('userId')].append(bet_doc)
+        else:
+            skipped += 1
+
+    if not bets_by_user:
+        print(f"Session {session_id}: No OPEN bets found.")
+        return {"bets": 0, "users": 0, "skipped": skipped, "unsettled": 0}
+
+    # 2. Wallets (one batched read); bets of missing users are left OPEN, except refunds
+    user_refs = [db.collection('users').document(uid) for uid in bets_by_user]
+    existing = {snap.id for snap in db.get_all(user_refs, field_paths=['walletBalance']) if snap.exists}
+
+    # 3. Commit per-user groups, packed into batches
+    settled = 0
+    unsettled = 0
+    pending = list(bets_by_user.items())
+    for attempt in range(SETTLEMENT_RETRIES + 1):
+        failed = []
+        for group in _pack_groups(pending, existing, matches_by_id):
+            batch = db.batch()
+            for uid, bet_docs, credit, updates in group:
+                for bet_doc, fields in updates:
+                    batch.update(bet_doc.reference, fields,
+                                 option=db.write_option(last_update_time=bet_doc.update_time))
+                if credit:
+                    user_ref = db.collection('users').document(uid)
+                    bet_ids = [bet_doc.id for bet_doc, _ in updates]
+                    batch.update(user_ref, {'walletBalance': firestore.Increment(credit)})
+                    batch.create(user_ref.collection('walletMutations').document(
+                        wallet_mutation_key(session_id, uid, bet_ids)
+                    ), {
+                        'amount': credit,
+                        'sessionId': session_id,
+                        'betIds': bet_ids,
+                        'createdAt': firestore.SERVER_TIMESTAMP
+                    })
+            try:
+                batch.commit()
+                settled += sum(len(updates) for _, _, _, updates in group)
+            except (google_exceptions.FailedPrecondition, google_exceptions.NotFound,
+                    google_exceptions.Conflict) as e:
+                print(f"Session {session_id}: settlement batch conflicted ({e}); re-reading.")
+                failed.extend((uid, bet_docs) for uid, bet_docs, _, _ in group)
+
+        if not failed:
+            break
+        # Re-read the conflicted users' bets; only those still OPEN are settled again
+        fresh = defaultdict(list)
+        for snap in db.get_all([d.reference for _, bet_docs in failed for d in bet_docs]):
+            if snap.exists and snap.to_dict().get('status') == 'OPEN':
+                fresh[snap.to_dict().get('userId')].append(snap)
+        pending = list(fresh.items())
+    else:
+        unsettled = len(pending)
+        print(f"Session {session_id}: gave up on {unsettled} users after {SETTLEMENT_RETRIES} retries.")
+
+    print(f"Session {session_id}: settled {settled} bets for {len(bets_by_user)} users.")
+    return {"bets": settled, "users": len(bets_by_user), "skipped": skipped, "unsettled": unsettled}
+
+def _pack_groups(pending, existing, matches_by_id):
+    """
+    Splits the per-user work into batches of at most SETTLEMENT_BATCH_SIZE
+    writes without splitting a user's credit from their bet updates (a
+    user with more bets than fit in one batch is split into self-contained
+    chunks).
+    """
+    groups = []
+    current = []
+    size = 0
+    for uid, bet_docs in pending:
+        # Room for the wallet increment and its mutation record
+        chunk_size = SETTLEMENT_BATCH_SIZE - 2
+        for i in range(0, len(bet_docs), chunk_size):
+            chunk = bet_docs[i:i + chunk_size]
+            credit = 0.0
+            updates = []
+            for bet_doc in chunk:
+                bet = bet_doc.to_dict()
+                match = matches_by_id[bet.get('matchId')]
+                fields, payout = _settlement(bet, match)
+                if uid not in existing and fields['status'] != 'REFUNDED':
+                    continue
+                updates.append((bet_doc, fields))
+                if uid in existing:
+                    credit += payout
+            if not updates:
+                continue
+
+            writes = len(updates) + (2 if credit else 0)
+            if size + writes > SETTLEMENT_BATCH_SIZE:
+                groups.append(current)
+                current, size = [], 0
+            current.append((uid, chunk, credit, updates))
+            size += writes
+    if current:
+        groups.append(current)
+    return groups
+
 def refund_bets_for_match(db, match_id):
     """
     Refunds all OPEN bets for a match (e.g. unplayed).
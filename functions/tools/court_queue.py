@@ -0,0 +1,184 @@
+import copy
+import heapq
+import itertools
+import time
+import uuid
+from typing import List, Dict, Optional
+
+from tools.scheduler import Scheduler, ScheduleEvaluator
+
+# How many of the longest-waiting players are considered to fill a court
+CANDIDATE_WINDOW = 7
+# Candidates may have at most this many more games than the first player up
+MAX_GAMES_AHEAD = 1
+
+class CourtQueue:
+    """
+    Open-play scheduling: instead of fixed rounds, whoever has waited longest
+    goes on the next court that frees up.
+
+    Waiting players sit in a heap ordered by (games played, time they became
+    ready). When a court frees up the first player up is popped along with
+    the next CANDIDATE_WINDOW players, and the three that give the lowest
+    pairing cost (partner/opponent repeats and skill, via ScheduleEvaluator)
+    join them; the rest go back on the heap. Each assignment is O(log n).
+
+    Partner/opponent counts are applied when a match starts, so players on
+    court are already accounted for when the next match is picked.
+    """
+    def __init__(self, players_data: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                 history: Optional[List[Dict]] = None, seed: Optional[int] = None):
+        self.scheduler = Scheduler(players_data, games_per_player, mode, seed=seed, history=history)
+        self.evaluator = ScheduleEvaluator(self.scheduler)
+        self.ids = [p.id for p in self.scheduler.players]
+
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self.courts = {}
+
+    # --- Waiting players ---
+
+    def add_waiting(self, player_id: str, ready_at: Optional[float] = None):
+        """Puts a player in line (or re-queues them with a new ready time)."""
+        idx = self.scheduler.index.get(player_id)
+        if idx is None:
+            return
+        self._discard(idx)
+        entry = [self.evaluator.games[idx], ready_at if ready_at is not None else time.time(), next(self._counter), idx]
+        self._entries[idx] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove_waiting(self, player_id: str):
+        """Takes a player out of line, e.g. when they leave for the night."""
+        idx = self.scheduler.index.get(player_id)
+        if idx is not None:
+            self._discard(idx)
+
+    def _discard(self, idx: int):
+        # Lazy deletion: the stale heap entry is skipped when it surfaces
+        entry = self._entries.pop(idx, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def _pop(self) -> Optional[list]:
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[-1] is not None:
+                del self._entries[entry[-1]]
+                return entry
+        return None
+
+    def waiting_count(self) -> int:
+        return len(self._entries)
+
+    # --- Courts ---
+
+    def next_match(self, court: int, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        Picks the next match for a court that just freed up. Returns None
+        (and changes nothing) if fewer than 4 players are waiting.
+        """
+        if len(self._entries) < 4:
+            return None
+        now = now if now is not None else time.time()
+
+        # 1. First player up plus the next few in line
+        first = self._pop()
+        candidates = []
+        while len(candidates) < CANDIDATE_WINDOW:
+            entry = self._pop()
+            if entry is None:
+                break
+            candidates.append(entry)
+
+        eligible = [e for e in candidates if e[0] <= first[0] + MAX_GAMES_AHEAD]
+        if len(eligible) < 3:
+            eligible = candidates
+
+        # 2. Cheapest group and team split; ties go to whoever has waited longest
+        evaluator = self.evaluator
+        a = first[-1]
+        best = None
+        for trio in itertools.combinations(range(len(eligible)), 3):
+            b, c, d = (eligible[k][-1] for k in trio)
+            for match in ((a, b, c, d), (a, c, b, d), (a, d, b, c)):
+                key = (evaluator.match_delta(*match), trio)
+                if best is None or key < best[0]:
+                    best = (key, match)
+
+        chosen = set(best[1])
+        for entry in candidates:
+            if entry[-1] not in chosen:
+                self._entries[entry[-1]] = entry
+                heapq.heappush(self._heap, entry)
+
+        # 3. Start the match
+        a, b, c, d = best[1]
+        evaluator.apply(a, b, c, d)
+        match = {
+            'id': str(uuid.uuid4()),
+            'team1': [self.ids[a], self.ids[b]],
+            'team2': [self.ids[c], self.ids[d]],
+            'court': court,
+            'startedAt': now
+        }
+        self.courts[court] = match
+        return match
+
+    def finish_match(self, court: int, now: Optional[float] = None) -> Optional[Dict]:
+        """Frees a court and puts its players back in line."""
+        match = self.courts.pop(court, None)
+        if match is None:
+            return None
+        now = now if now is not None else time.time()
+        for pid in match['team1'] + match['team2']:
+            self.add_waiting(pid, now)
+        return match
+
+    def copy(self) -> 'CourtQueue':
+        """
+        An independent copy to mutate, e.g. inside a transaction that may be
+        retried. The scheduler (players, ratings, config) is shared.
+        """
+        counter, self._counter = self._counter, None
+        try:
+            clone = copy.deepcopy(self, {id(self.scheduler): self.scheduler})
+        finally:
+            self._counter = counter
+        # Tie-breaks only need to keep increasing in each queue
+        clone._counter = itertools.count(next(counter))
+        return clone
+
+    # --- Persistence ---
+
+    def ready_times(self) -> Dict[str, float]:
+        return {self.ids[idx]: entry[1] for idx, entry in self._entries.items()}
+
+    @classmethod
+    def from_session(cls, players_data: List[Dict], matches: List[Dict], games_per_player: int = 4,
+                     mode: str = "STRICT_SOCIAL", ready_at: Optional[Dict[str, float]] = None,
+                     courts: Optional[Dict[str, str]] = None, now: Optional[float] = None) -> 'CourtQueue':
+        """
+        Rebuilds a queue from a session: `matches` are everything started so
+        far, `courts` maps court number to the match currently on it, and
+        `ready_at` holds when each waiting player came off court.
+        """
+        ready_at = ready_at or {}
+        courts = courts or {}
+        now = now if now is not None else time.time()
+        queue = cls(players_data, games_per_player, mode, history=matches)
+
+        by_id = {m.get('id'): m for m in matches}
+        on_court = set()
+        for court, match_id in courts.items():
+            match = by_id.get(match_id)
+            if match is None:
+                continue
+            queue.courts[int(court)] = match
+            on_court.update(match['team1'] + match['team2'])
+
+        for pid in queue.ids:
+            if pid not in on_court:
+                queue.add_waiting(pid, ready_at.get(pid, now))
+        return queue
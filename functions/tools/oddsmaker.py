@@ -0,0 +1,64 @@
+from typing import List, Dict, Optional
+
+import numpy as np
+
+# Port of src/services/Oddsmaker.js: 5 rating points = 1 game point of spread
+SCALING_FACTOR = 0.2
+DEFAULT_RATING = 35.0
+
+def _rating(player: Optional[Dict]) -> float:
+    # Same fallback as the client: missing or zero ratings count as 35
+    if player is None:
+        return float('nan')
+    return float(player.get('hiddenRating') or DEFAULT_RATING)
+
+def calculate_spreads(matches: List[Dict], players_by_id: Dict[str, Dict]):
+    """
+    Spreads for every match in one vectorized pass. Returns (spreads,
+    favorite_teams): spreads are non-negative multiples of 0.5 and
+    favorite_teams holds 1, 2 or None (even). Players missing from
+    `players_by_id` are left out of their team's average, and a team with
+    nobody known gets spread 0, as in the client.
+    """
+    if not matches:
+        return [], []
+
+    ratings = np.full((len(matches), 4), np.nan)
+    for i, m in enumerate(matches):
+        team1, team2 = list(m.get('team1', []))[:2], list(m.get('team2', []))[:2]
+        for j, pid in enumerate(team1):
+            ratings[i, j] = _rating(players_by_id.get(pid))
+        for j, pid in enumerate(team2):
+            ratings[i, 2 + j] = _rating(players_by_id.get(pid))
+
+    t1, t2 = ratings[:, :2], ratings[:, 2:]
+    known1 = (~np.isnan(t1)).sum(axis=1)
+    known2 = (~np.isnan(t2)).sum(axis=1)
+    valid = (known1 > 0) & (known2 > 0)
+
+    diff = np.zeros(len(matches))
+    diff[valid] = (
+        np.nansum(t1[valid], axis=1) / known1[valid] - np.nansum(t2[valid], axis=1) / known2[valid]
+    )
+
+    # Math.round rounds halves up, unlike np.round
+    spreads = np.floor(np.abs(diff * SCALING_FACTOR) * 2 + 0.5) / 2
+    favorites = [1 if d > 0 else 2 if d < 0 else None for d in diff.tolist()]
+    return spreads.tolist(), favorites
+
+def apply_spreads(matches: List[Dict], players_by_id: Dict[str, Dict]) -> List[Dict]:
+    """Copies of `matches` with 'spread' and 'favoriteTeam' set."""
+    spreads, favorites = calculate_spreads(matches, players_by_id)
+    return [
+        {**m, 'spread': spread, 'favoriteTeam': favorite}
+        for m, spread, favorite in zip(matches, spreads, favorites)
+    ]
+
+def refresh_unplayed_spreads(matches: List[Dict], players_by_id: Dict[str, Dict]) -> List[Dict]:
+    """Re-prices matches that have no score yet; scored matches keep the odds they were bet at."""
+    unplayed = [i for i, m in enumerate(matches) if m.get('team1Score') is None or m.get('team2Score') is None]
+    priced = apply_spreads([matches[i] for i in unplayed], players_by_id)
+    updated = list(matches)
+    for i, m in zip(unplayed, priced):
+        updated[i] = m
+    return updated
@@ -0,0 +1,148 @@
+import datetime
+import re
+from typing import List, Dict, Optional
+
+from firebase_admin import firestore
+
+# Firestore transactions allow 500 writes; sessions are far smaller
+MAX_PLAYERS_PER_APPEND = 500
+# Longest start..end range one read may cover
+MAX_HISTORY_MONTHS = 36
+
+_PERIOD = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+
+def get_db():
+    return firestore.client()
+
+def history_ref(db, player_id: str, period: str):
+    """players/{playerId}/ratingHistory/{YYYY-MM}: one document per player per month."""
+    return db.collection('players').document(player_id).collection('ratingHistory').document(period)
+
+def period_of(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m')
+
+def session_time(session: Dict) -> float:
+    """When a session was played (scheduledDate), falling back to now."""
+    value = session.get('scheduledDate')
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if value:
+        try:
+            parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            return parsed.timestamp()
+        except ValueError:
+            pass
+    return datetime.datetime.now(datetime.timezone.utc).timestamp()
+
+def _month_number(period) -> int:
+    if not isinstance(period, str) or not _PERIOD.fullmatch(period):
+        raise ValueError(f"Invalid period {period!r}, expected YYYY-MM")
+    return int(period[:4]) * 12 + int(period[5:7]) - 1
+
+def validate_range(start: Optional[str], end: Optional[str]):
+    """
+    Raises ValueError unless start and end (either may be None) are
+    'YYYY-MM' periods, start <= end, and the range spans at most
+    MAX_HISTORY_MONTHS. A missing end with a start means the current month.
+    """
+    if end is not None:
+        _month_number(end)
+    if start is None:
+        return
+    end = end or period_of(datetime.datetime.now(datetime.timezone.utc).timestamp())
+    months = _month_number(end) - _month_number(start) + 1
+    if months < 1:
+        raise ValueError(f"start {start} is after end {end}")
+    if months > MAX_HISTORY_MONTHS:
+        raise ValueError(f"Range {start}..{end} spans {months} months; the limit is {MAX_HISTORY_MONTHS}")
+
+def _periods(start: str, end: str) -> List[str]:
+    first, last = _month_number(start), _month_number(end)
+    return [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in range(first, last + 1)]
+
+def append_session(db, session_id: str, timestamp: float, points: Dict[str, List[tuple]]) -> int:
+    """
+    Appends one session's rating points to each player's history.
+    `points` maps player ID to [(match_id, rating_after_match), ...] in
+    play order, so the last point is the post-session rating.
+
+    Runs in a transaction, so concurrent sessions never drop each other's
+    points, and skips players whose document already lists this session,
+    so a retried complete_session does not append twice. Returns how many
+    players were appended.
+    """
+    player_ids = sorted(pid for pid, player_points in points.items() if player_points)
+    if not player_ids: return 0
+    if len(player_ids) > MAX_PLAYERS_PER_APPEND:
+        raise ValueError(f"Cannot append more than {MAX_PLAYERS_PER_APPEND} players at once")
+
+    period = period_of(timestamp)
+    refs = [history_ref(db, pid, period) for pid in player_ids]
+    return _append_transaction(db.transaction(), db, refs, player_ids, period, session_id, timestamp, points)
+
+@firestore.transactional
+def _append_transaction(transaction, db, refs, player_ids, period, session_id, timestamp, points):
+    docs = {doc.reference.path: doc for doc in db.get_all(refs, transaction=transaction)}
+
+    appended = 0
+    for ref, pid in zip(refs, player_ids):
+        doc = docs.get(ref.path)
+        data = doc.to_dict() if doc is not None and doc.exists else {
+            'playerId': pid, 'period': period,
+            'timestamps': [], 'ratings': [], 'matchIds': [], 'sessionIds': []
+        }
+        if session_id in data['sessionIds']:
+            continue
+
+        for match_id, rating in points[pid]:
+            data['timestamps'].append(timestamp)
+            data['ratings'].append(round(float(rating), 4))
+            data['matchIds'].append(match_id)
+        data['sessionIds'].append(session_id)
+        data['updatedAt'] = firestore.SERVER_TIMESTAMP
+        transaction.set(ref, data)
+        appended += 1
+    return appended
+
+def _unpack(docs) -> Dict:
+    history = {'timestamps': [], 'ratings': [], 'matchIds': []}
+    for data in sorted((d for d in docs if d), key=lambda d: d.get('period', '')):
+        history['timestamps'].extend(data.get('timestamps', []))
+        history['ratings'].extend(data.get('ratings', []))
+        history['matchIds'].extend(data.get('matchIds', []))
+    return history
+
+def get_histories(db, player_ids: List[str], start: Optional[str] = None,
+                  end: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Rating histories for several players: {player_id: {timestamps, ratings,
+    matchIds}}, oldest first. With a start period ('YYYY-MM') every month
+    document is fetched in one batched read; without one, each player's
+    history is a single query. Raises ValueError for a range that
+    validate_range rejects.
+    """
+    validate_range(start or None, end or None)
+    if start:
+        end = end or period_of(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        periods = _periods(start, end)
+        refs = [history_ref(db, pid, period) for pid in player_ids for period in periods]
+        by_player = {pid: [] for pid in player_ids}
+        for doc in db.get_all(refs):
+            if doc.exists:
+                data = doc.to_dict()
+                by_player.setdefault(data.get('playerId'), []).append(data)
+        return {pid: _unpack(by_player.get(pid, [])) for pid in player_ids}
+
+    histories = {}
+    for pid in player_ids:
+        query = db.collection('players').document(pid).collection('ratingHistory')
+        if end:
+            query = query.where(filter=firestore.FieldFilter('period', '<=', end))
+        histories[pid] = _unpack(doc.to_dict() for doc in query.stream())
+    return histories
+
+def get_history(db, player_id: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+    """One player's rating history; see get_histories."""
+    return get_histories(db, [player_id], start, end)[player_id]
@@ -0,0 +1,323 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+import numpy as np
+from firebase_admin import firestore
+
+from tools import rating_history
+from tools.ratings import K_FACTOR, SCALE_FACTOR, DEFAULT_RATING
+
+# A checkpoint is saved after every this many matches (segment boundaries)
+CHECKPOINT_INTERVAL = 1000
+# Firestore allows 500 writes per batch
+WRITE_BATCH_SIZE = 500
+
+# Team 1 gains, team 2 loses
+SLOT_SIGNS = np.array([1.0, 1.0, -1.0, -1.0])
+
+@dataclass
+class MatchLog:
+    """
+    Every scored match in chronological order, as arrays. Slots 0-1 are
+    team 1 and 2-3 team 2 (player indices into player_ids, -1 if empty);
+    outcomes is team 1's actual score (1 win, 0 loss, 0.5 draw).
+    """
+    player_ids: List[str]
+    match_ids: List[str]
+    slots: np.ndarray
+    outcomes: np.ndarray
+    # Running hash of the log, used to check a checkpoint still describes the same history
+    fingerprints: Dict[int, str] = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.match_ids)
+
+@dataclass
+class ReplayResult:
+    player_ids: List[str]
+    ratings: np.ndarray
+    match_count: int
+    resumed_from: int = 0
+    checkpoints_saved: int = 0
+    # Only for the matches replayed in this run (start at resumed_from)
+    trajectories: Optional[Dict] = None
+
+    def ratings_by_id(self) -> Dict[str, float]:
+        return {pid: float(r) for pid, r in zip(self.player_ids, self.ratings.tolist())}
+
+def _session_order(item):
+    # Parsed dates, as schedule_league orders weeks; date strings do not sort reliably
+    session_id, session = item
+    return (rating_history.session_time(session), str(session.get('createdAt') or ''), session_id)
+
+def build_match_log(sessions: Dict[str, Dict], checkpoint_interval: int = CHECKPOINT_INTERVAL) -> MatchLog:
+    """
+    Flattens sessions ({session_id: session}) into a MatchLog. Sessions are
+    ordered by scheduledDate and matches keep their order within a session,
+    which is the order complete_session applied them in. Matches whose
+    scores do not parse are skipped, as update_ratings ignores them.
+    """
+    index = {}
+    player_ids = []
+    match_ids = []
+    slots = []
+    outcomes = []
+    fingerprints = {0: hashlib.sha256().hexdigest()}
+    digest = hashlib.sha256()
+
+    for session_id, session in sorted(sessions.items(), key=_session_order):
+        for m in session.get('matches', []):
+            if m.get('team1Score') is None or m.get('team2Score') is None:
+                continue
+            try:
+                s1, s2 = int(m['team1Score']), int(m['team2Score'])
+            except (TypeError, ValueError):
+                continue
+
+            row = [-1, -1, -1, -1]
+            for offset, team in ((0, m.get('team1', [])), (2, m.get('team2', []))):
+                for j, pid in enumerate(list(team)[:2]):
+                    if pid not in index:
+                        index[pid] = len(player_ids)
+                        player_ids.append(pid)
+                    row[offset + j] = index[pid]
+
+            slots.append(row)
+            outcomes.append(1.0 if s1 > s2 else 0.0 if s1 < s2 else 0.5)
+            match_ids.append(str(m.get('id') or ''))
+            digest.update(json.dumps(
+                [session_id, m.get('id'), list(m.get('team1', [])), list(m.get('team2', [])), s1, s2],
+                separators=(',', ':')
+            ).encode('utf-8'))
+            if len(match_ids) % checkpoint_interval == 0:
+                fingerprints[len(match_ids)] = digest.copy().hexdigest()
+
+    fingerprints[len(match_ids)] = digest.hexdigest()
+    return MatchLog(
+        player_ids=player_ids,
+        match_ids=match_ids,
+        slots=np.array(slots, dtype=np.int64).reshape(-1, 4),
+        outcomes=np.array(outcomes, dtype=np.float64),
+        fingerprints=fingerprints
+    )
+
+def load_match_log(db=None, checkpoint_interval: int = CHECKPOINT_INTERVAL) -> MatchLog:
+    """Reads every completed session from Firestore into a MatchLog."""
+    db = db or firestore.client()
+    query = db.collection('sessions').where(filter=firestore.FieldFilter('status', '==', 'COMPLETED'))
+    return build_match_log({doc.id: doc.to_dict() for doc in query.stream()}, checkpoint_interval)
+
+def _levels(slots: np.ndarray, sentinel: int) -> np.ndarray:
+    """
+    Dependency level of each match: one more than the latest level of any
+    of its players. Matches on the same level share no players, so they can
+    be updated together without changing the sequential result.
+    """
+    last = [-1] * (sentinel + 1)
+    levels = []
+    for a, b, c, d in slots.tolist():
+        level = max(last[a], last[b], last[c], last[d]) + 1
+        last[a] = last[b] = last[c] = last[d] = level
+        last[sentinel] = -1
+        levels.append(level)
+    return np.array(levels, dtype=np.int64)
+
+def _replay_segment(ratings: np.ndarray, slots: np.ndarray, outcomes: np.ndarray, k_factor: float,
+                    scale_factor: float, default_rating: float, trajectory: Optional[Dict] = None):
+    """
+    Applies one segment of matches to `ratings` in place, one dependency
+    level at a time. The last entry of `ratings` is a scratch slot that
+    empty seats read from and write to.
+    """
+    sentinel = len(ratings) - 1
+    mask = slots >= 0
+    slots = np.where(mask, slots, sentinel)
+
+    # Team averages as one weighted sum: +1/n for team 1 seats, -1/n for team 2
+    n1 = mask[:, :2].sum(axis=1, keepdims=True)
+    n2 = mask[:, 2:].sum(axis=1, keepdims=True)
+    weights = np.hstack([mask[:, :2] / np.maximum(n1, 1), -(mask[:, 2:] / np.maximum(n2, 1))])
+    # An empty team counts as default_rating, as in update_ratings
+    offsets = default_rating * ((n1 == 0).astype(float) - (n2 == 0).astype(float)).ravel()
+
+    # Sort once so every level is a contiguous slice
+    levels = _levels(slots, sentinel)
+    order = np.argsort(levels, kind='stable')
+    slots, weights, offsets, outcomes = slots[order], weights[order], offsets[order], outcomes[order]
+    bounds = [0] + (np.flatnonzero(np.diff(levels[order])) + 1).tolist() + [len(order)]
+    after = np.empty(slots.shape) if trajectory is not None else None
+    expected_all = np.empty(len(order)) if trajectory is not None else None
+
+    for lo, hi in zip(bounds, bounds[1:]):
+        idx = slots[lo:hi]
+        current = ratings[idx]
+        # update_ratings reads a rating of 0 as "missing" and uses the default
+        current[current == 0.0] = default_rating
+
+        diff = np.einsum('ij,ij->i', current, weights[lo:hi]) + offsets[lo:hi]
+        expected = 1.0 / (1.0 + np.power(10.0, -diff / scale_factor))
+        change = k_factor * (outcomes[lo:hi] - expected)
+        updated = np.maximum(0.0, current + change[:, None] * SLOT_SIGNS)
+        ratings[idx] = updated
+
+        if after is not None:
+            after[lo:hi] = updated
+            expected_all[lo:hi] = expected
+
+    if trajectory is not None:
+        after[~mask[order]] = np.nan
+        trajectory['ratingsAfter'][order] = after
+        trajectory['expected'][order] = expected_all
+        trajectory['change'][order] = k_factor * (outcomes - expected_all)
+
+def apply_matches(ratings: np.ndarray, slots: np.ndarray, outcomes: np.ndarray, k_factor: float = K_FACTOR,
+                  scale_factor: float = SCALE_FACTOR, default_rating: float = DEFAULT_RATING):
+    """
+    Applies matches to `ratings` in place, with the same result as calling
+    update_ratings on each in order. `slots` holds player indices (-1 for an
+    empty seat) and `outcomes` is 1.0 when team 1 won. Like replay's own
+    array, `ratings` needs one extra scratch entry at the end for empty
+    seats.
+    """
+    _replay_segment(ratings, np.asarray(slots), np.asarray(outcomes, dtype=float),
+                    k_factor, scale_factor, default_rating)
+
+def params_key(k_factor: float, scale_factor: float, default_rating: float,
+               initial_ratings: Optional[Dict[str, float]] = None) -> str:
+    """Checkpoints are only reusable by replays with the same parameters and starting ratings."""
+    payload = json.dumps({
+        'k': k_factor, 'scale': scale_factor, 'default': default_rating,
+        'initial': sorted((initial_ratings or {}).items())
+    }, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+class MemoryCheckpointStore:
+    """Checkpoints kept in a dict; handy for sweeps and scripts."""
+    def __init__(self):
+        self._checkpoints = {}
+
+    def get(self, key: str, match_count: int, fingerprint: str) -> Optional[Dict]:
+        return self._checkpoints.get((key, match_count, fingerprint))
+
+    def save(self, key: str, checkpoint: Dict):
+        self._checkpoints[(key, checkpoint['matchCount'], checkpoint['fingerprint'])] = checkpoint
+
+class FirestoreCheckpointStore:
+    """Checkpoints under ratingReplays/{paramsKey}/checkpoints/{matchCount}-{fingerprint}."""
+    def __init__(self, collection: str = 'ratingReplays'):
+        self.collection = collection
+        self._db = None
+
+    def _ref(self, key: str, match_count: int, fingerprint: str):
+        if self._db is None:
+            self._db = firestore.client()
+        return (self._db.collection(self.collection).document(key)
+                .collection('checkpoints').document(f"{match_count:09d}-{fingerprint[:16]}"))
+
+    def get(self, key: str, match_count: int, fingerprint: str) -> Optional[Dict]:
+        snap = self._ref(key, match_count, fingerprint).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict()
+        return data if data.get('fingerprint') == fingerprint else None
+
+    def save(self, key: str, checkpoint: Dict):
+        ref = self._ref(key, checkpoint['matchCount'], checkpoint['fingerprint'])
+        ref.set({**checkpoint, 'createdAt': firestore.SERVER_TIMESTAMP})
+
+def replay(log: MatchLog, k_factor: float = K_FACTOR, scale_factor: float = SCALE_FACTOR,
+           default_rating: float = DEFAULT_RATING, initial_ratings: Optional[Dict[str, float]] = None,
+           store=None, resume: bool = True, trajectories: bool = False) -> ReplayResult:
+    """
+    Replays every match in `log` and returns the final ratings. Gives the
+    same ratings as running update_ratings match by match (up to float
+    rounding), but in NumPy.
+
+    Everyone starts at default_rating unless initial_ratings says
+    otherwise. With a store, a checkpoint is saved at every segment
+    boundary, and (if resume is set) the replay starts from the latest
+    checkpoint whose history still matches the log. Trajectories cover only
+    the matches replayed in this run; pass resume=False for all of them.
+    """
+    n = len(log.player_ids)
+    # One extra scratch slot for empty seats (see _replay_segment)
+    ratings = np.full(n + 1, float(default_rating))
+    for i, pid in enumerate(log.player_ids):
+        if initial_ratings and initial_ratings.get(pid):
+            ratings[i] = float(initial_ratings[pid])
+
+    key = params_key(k_factor, scale_factor, default_rating, initial_ratings)
+    boundaries = sorted(log.fingerprints)
+
+    # 1. Resume from the latest checkpoint that still matches
+    start = 0
+    if store is not None and resume:
+        for count in reversed(boundaries[1:]):
+            checkpoint = store.get(key, count, log.fingerprints[count])
+            if checkpoint is None:
+                continue
+            index = {pid: i for i, pid in enumerate(log.player_ids)}
+            for pid, rating in zip(checkpoint['playerIds'], checkpoint['ratings']):
+                if pid in index:
+                    ratings[index[pid]] = rating
+            start = count
+            break
+
+    trajectory = None
+    if trajectories:
+        replayed = len(log) - start
+        trajectory = {
+            'ratingsAfter': np.full((replayed, 4), np.nan),
+            'expected': np.zeros(replayed),
+            'change': np.zeros(replayed)
+        }
+
+    # 2. Replay segment by segment, checkpointing at each boundary
+    saved = 0
+    seen = 0
+    for lo, hi in zip(boundaries, boundaries[1:]):
+        # Players are numbered by first appearance, so the prefix's players come first
+        seen = max(seen, int(log.slots[lo:hi].max()) + 1)
+        if hi <= start:
+            continue
+        segment = None
+        if trajectory is not None:
+            segment = {name: values[lo - start:hi - start] for name, values in trajectory.items()}
+        _replay_segment(ratings, log.slots[lo:hi], log.outcomes[lo:hi],
+                        k_factor, scale_factor, default_rating, segment)
+
+        if store is not None:
+            store.save(key, {
+                'matchCount': hi,
+                'fingerprint': log.fingerprints[hi],
+                'playerIds': log.player_ids[:seen],
+                'ratings': ratings[:seen].tolist()
+            })
+            saved += 1
+
+    result = ReplayResult(
+        player_ids=list(log.player_ids), ratings=ratings[:n].copy(), match_count=len(log),
+        resumed_from=start, checkpoints_saved=saved
+    )
+    if trajectory is not None:
+        result.trajectories = {
+            'matchIds': log.match_ids[start:],
+            'slots': log.slots[start:],
+            **trajectory
+        }
+    return result
+
+def write_ratings(db, ratings_by_id: Dict[str, float]) -> int:
+    """
+    Saves ratings as hiddenRating, in batches of WRITE_BATCH_SIZE. Every
+    player must still exist, or that batch fails.
+    """
+    items = list(ratings_by_id.items())
+    for i in range(0, len(items), WRITE_BATCH_SIZE):
+        batch = db.batch()
+        for pid, rating in items[i:i + WRITE_BATCH_SIZE]:
+            batch.update(db.collection('players').document(pid), {'hiddenRating': rating})
+        batch.commit()
+    return len(items)
@@ -0,0 +1,223 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from tools import scheduler
+from tools.rating_replay import MatchLog, replay, apply_matches, CHECKPOINT_INTERVAL
+from tools.ratings import K_FACTOR, SCALE_FACTOR, DEFAULT_RATING
+
+# Simulated players' true skills are on the rating scale
+TRUE_SKILL_MEAN = 35.0
+TRUE_SKILL_SD = 6.0
+# How a true skill gap turns into a win probability in the simulated world
+TRUE_SCALE = 40.0
+# Ratings have converged once the average error is within this share of its long-run level
+CONVERGENCE_MARGIN = 0.1
+# Error-by-games curve is reported at these game counts
+REPORT_GAMES = [0, 5, 10, 20, 40, 80]
+# Search effort per simulated session; templates cover the common roster sizes
+SESSION_ITERATIONS = 5
+
+@dataclass
+class SimulatedWorld:
+    """
+    One simulated club: true skills plus every match played, in order.
+    Schedules come from the real scheduler fed the ratings the club would
+    have had under the current constants; outcomes depend only on true
+    skills, so every parameter set can replay the exact same matches.
+    """
+    seed: int
+    skills: np.ndarray
+    log: MatchLog
+    # Win probability of team 1 under the true skills, for the oracle score
+    true_probabilities: np.ndarray
+
+def simulate_world(seed: int, players: int = 200, sessions: int = 2000, session_size: int = 16,
+                   games_per_player: int = 4, mode: str = "STRICT_SOCIAL", starting_share: float = 0.25,
+                   true_scale: float = TRUE_SCALE) -> SimulatedWorld:
+    """
+    Plays `sessions` sessions among `players` synthetic players. A
+    `starting_share` of them play from the first session; the rest join
+    over the first three quarters of the season, so the default rating
+    matters for newcomers.
+    """
+    rng = np.random.default_rng(seed)
+    skills = np.clip(rng.normal(TRUE_SKILL_MEAN, TRUE_SKILL_SD, players), 5.0, None)
+
+    # 1. Arrivals
+    starters = max(session_size, int(players * starting_share))
+    arrivals = np.zeros(players, dtype=np.int64)
+    arrivals[starters:] = rng.integers(0, max(1, int(sessions * 0.75)), players - starters)
+
+    # One extra scratch slot, as in rating_replay
+    ratings = np.full(players + 1, DEFAULT_RATING)
+    slots = []
+    outcomes = []
+    probabilities = []
+
+    for s in range(sessions):
+        # 2. Roster and schedule
+        present = np.flatnonzero(arrivals <= s)
+        roster = rng.choice(present, size=min(session_size, len(present)), replace=False)
+        result = scheduler.generate_schedule(
+            [{'id': str(i), 'hiddenRating': float(ratings[i])} for i in roster.tolist()],
+            games_per_player, mode, iterations=SESSION_ITERATIONS, seed=seed * 1000003 + s
+        )
+        rows = np.array([[int(pid) for pid in m['team1'] + m['team2']] for m in result.matches], dtype=np.int64)
+
+        # 3. Outcomes from true skills
+        diff = skills[rows[:, :2]].mean(axis=1) - skills[rows[:, 2:]].mean(axis=1)
+        p = 1.0 / (1.0 + np.power(10.0, -diff / true_scale))
+        won = (rng.random(len(rows)) < p).astype(np.float64)
+
+        # 4. Ratings the next session is scheduled with
+        apply_matches(ratings, rows, won, K_FACTOR, SCALE_FACTOR, DEFAULT_RATING)
+        slots.append(rows)
+        outcomes.append(won)
+        probabilities.append(p)
+
+    slots = np.concatenate(slots) if slots else np.zeros((0, 4), dtype=np.int64)
+    count = len(slots)
+    # Simulated worlds are never checkpointed; the boundaries only define replay segments
+    boundaries = {c: f"sim-{seed}-{c}" for c in list(range(0, count, CHECKPOINT_INTERVAL)) + [count]}
+    log = MatchLog(
+        player_ids=[str(i) for i in range(players)],
+        match_ids=[str(i) for i in range(count)],
+        slots=slots,
+        outcomes=np.concatenate(outcomes) if outcomes else np.zeros(0),
+        fingerprints=boundaries
+    )
+    return SimulatedWorld(
+        seed=seed, skills=skills, log=log,
+        true_probabilities=np.concatenate(probabilities) if probabilities else np.zeros(0)
+    )
+
+def _error_by_games(slots: np.ndarray, ratings_after: np.ndarray, skills: np.ndarray, default_rating: float):
+    """Mean |rating - true skill| after each player's g-th game (g=0 is the default rating)."""
+    players = slots.ravel()
+    errors = np.abs(ratings_after.ravel() - skills[np.maximum(players, 0)])
+    valid = players >= 0
+    players, errors = players[valid], errors[valid]
+
+    # Number each appearance 1, 2, 3... per player, keeping chronological order
+    order = np.argsort(players, kind='stable')
+    counts = np.bincount(players, minlength=len(skills))
+    starts = np.cumsum(counts) - counts
+    games = np.empty(len(players), dtype=np.int64)
+    games[order] = np.arange(len(players)) - np.repeat(starts, counts) + 1
+
+    played = counts > 0
+    totals = np.bincount(games, weights=errors)
+    seen = np.bincount(games)
+    curve = np.divide(totals, seen, out=np.full(len(totals), np.nan), where=seen > 0)
+    curve[0] = np.abs(default_rating - skills[played]).mean() if played.any() else np.nan
+    return curve
+
+def evaluate(world: SimulatedWorld, k_factor: float, scale_factor: float, default_rating: float) -> Dict:
+    """Replays a world under one parameter set and scores how well the ratings track true skill."""
+    result = replay(world.log, k_factor, scale_factor, default_rating, trajectories=True)
+    expected = result.trajectories['expected']
+    outcomes = world.log.outcomes
+    half = len(outcomes) // 2
+
+    # Prediction error: expected score before each match vs what happened
+    squared = (expected - outcomes) ** 2
+    clipped = np.clip(expected, 1e-9, 1 - 1e-9)
+    log_loss = -(outcomes * np.log(clipped) + (1 - outcomes) * np.log(1 - clipped))
+    oracle = (world.true_probabilities - outcomes) ** 2
+
+    # Convergence: error against true skill by number of games played
+    curve = _error_by_games(world.log.slots, result.trajectories['ratingsAfter'], world.skills, default_rating)
+    games_played = np.bincount(world.log.slots[world.log.slots >= 0], minlength=len(world.skills))
+    played = games_played > 0
+    # Long-run error: second half of the games a typical player gets to
+    typical = max(2, int(np.median(games_played[played]))) if played.any() else 2
+    steady = float(np.nanmean(curve[typical // 2:typical + 1]))
+    converged = np.flatnonzero(np.abs(curve[:typical + 1] - steady) <= CONVERGENCE_MARGIN * steady)
+
+    final = result.ratings[played]
+    truth = world.skills[played]
+    rank_correlation = np.corrcoef(np.argsort(np.argsort(final)), np.argsort(np.argsort(truth)))[0, 1]
+
+    return {
+        'matches': len(outcomes),
+        'brier': float(squared.mean()),
+        'brierSecondHalf': float(squared[half:].mean()),
+        'brierOracle': float(oracle.mean()),
+        'logLoss': float(log_loss.mean()),
+        'finalRmse': float(np.sqrt(((final - truth) ** 2).mean())),
+        'rankCorrelation': float(rank_correlation),
+        'steadyStateError': steady,
+        'gamesToConverge': int(converged[0]) if len(converged) else None,
+        'errorByGames': {str(g): float(curve[g]) for g in REPORT_GAMES if g < len(curve)}
+    }
+
+# Worker processes hold the worlds once instead of receiving them with every task
+_worlds = []
+
+def _init_worker(worlds):
+    global _worlds
+    _worlds = worlds
+
+def _evaluate_task(args):
+    world_index, params = args
+    return world_index, params, evaluate(_worlds[world_index], *params)
+
+def _simulate_task(args):
+    seed, kwargs = args
+    return simulate_world(seed, **kwargs)
+
+def _average(runs: List[Dict]) -> Dict:
+    summary = {'matches': sum(r['matches'] for r in runs)}
+    for name in ('brier', 'brierSecondHalf', 'brierOracle', 'logLoss', 'finalRmse', 'rankCorrelation',
+                 'steadyStateError'):
+        summary[name] = round(float(np.mean([r[name] for r in runs])), 5)
+    games = [r['gamesToConverge'] for r in runs]
+    # Worlds that never converge hold the average back as None
+    summary['gamesToConverge'] = None if None in games else round(float(np.mean(games)), 1)
+    summary['errorByGames'] = {
+        g: round(float(np.mean([r['errorByGames'][g] for r in runs if g in r['errorByGames']])), 3)
+        for g in runs[0]['errorByGames']
+    }
+    return summary
+
+def sweep(k_factors: List[float], scale_factors: List[float], default_ratings: List[float],
+          worlds: int = 4, workers: Optional[int] = None, seed: int = 1, **world_kwargs) -> List[Dict]:
+    """
+    Scores every combination of the given constants on the same simulated
+    worlds, in parallel. Worlds are simulated once (one task each), then
+    each (world, parameters) pair is replayed as its own task. Results are
+    averaged over worlds and sorted by second-half Brier score.
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = [seed + i for i in range(worlds)]
+    grid = list(product(k_factors, scale_factors, default_ratings))
+
+    # 1. Simulate Worlds
+    if workers > 1 and worlds > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, worlds)) as pool:
+            simulated = list(pool.map(_simulate_task, [(s, world_kwargs) for s in seeds]))
+    else:
+        simulated = [simulate_world(s, **world_kwargs) for s in seeds]
+
+    # 2. Replay Every Parameter Set
+    tasks = [(w, params) for params in grid for w in range(len(simulated))]
+    runs = {params: [] for params in grid}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(simulated,)) as pool:
+            for _, params, outcome in pool.map(_evaluate_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                runs[params].append(outcome)
+    else:
+        for w, params in tasks:
+            runs[params].append(evaluate(simulated[w], *params))
+
+    results = [
+        {'kFactor': k, 'scaleFactor': scale, 'defaultRating': default, **_average(runs[(k, scale, default)])}
+        for k, scale, default in grid
+    ]
+    results.sort(key=lambda r: r['brierSecondHalf'])
+    return results
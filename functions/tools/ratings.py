@@ -1,5 +1,10 @@
 import math
 
+# ELO Parameters (shared with tools/rating_replay.py)
+K_FACTOR = 4.0
+SCALE_FACTOR = 40.0
+DEFAULT_RATING = 35.0
+
 def update_ratings(match, team1_players, team2_players):
     """
     Calculates ELO rating updates for a match.
@@ -19,14 +24,12 @@ def update_ratings(match, team1_players, team2_players):
 
     # 1. Calculate Team Averages
     def get_rating(p):
-        return float(p.get('hiddenRating') or p.get('hiddenRanking') or 35.0)
+        return float(p.get('hiddenRating') or p.get('hiddenRanking') or DEFAULT_RATING)
 
-    t1_avg = sum(get_rating(p) for p in team1_players) / len(team1_players) if team1_players else 35.0
-    t2_avg = sum(get_rating(p) for p in team2_players) / len(team2_players) if team2_players else 35.0
+    t1_avg = sum(get_rating(p) for p in team1_players) / len(team1_players) if team1_players else DEFAULT_RATING
+    t2_avg = sum(get_rating(p) for p in team2_players) / len(team2_players) if team2_players else DEFAULT_RATING
 
-    # 2. ELO Parameters
-    K_FACTOR = 4.0
-    SCALE_FACTOR = 40.0
+    # 2. ELO Parameters: module-level K_FACTOR and SCALE_FACTOR
 
     # 3. Expected Score for Team 1
     # Formula: 1 / (1 + 10 ^ ((RatingB - RatingA) / Scale))
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from firebase_admin import firestore
+
+# Ratings within the same bucket produce the same cache key
+RATING_BUCKET_SIZE = 1.0
+PERSISTENT_TTL_SECONDS = 7 * 24 * 3600
+# Search options at these values (or None) leave the key unchanged
+DEFAULT_SEARCH_OPTIONS = {'useTemplates': True}
+
+def canonical_key(players: List[Dict], games_per_player: int, mode: str,
+                  options: Optional[Dict] = None) -> str:
+    """
+    Hash of the inputs that determine a schedule: the set of player IDs, each
+    player's rating bucket, games per player and mode, plus any search
+    options (seed, iterations, time budget...) that differ from the
+    defaults. Player order does not matter.
+    """
+    roster = sorted(
+        (str(p.get('id')), int(float(p.get('hiddenRanking') or p.get('hiddenRating') or 35.0) // RATING_BUCKET_SIZE))
+        for p in players
+    )
+    key = {'roster': roster, 'gamesPerPlayer': games_per_player, 'mode': mode}
+    options = {
+        name: value for name, value in sorted((options or {}).items())
+        if value is not None and value != DEFAULT_SEARCH_OPTIONS.get(name)
+    }
+    if options:
+        key['options'] = options
+    payload = json.dumps(key, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class FirestoreScheduleStore:
+    """Persistent cache tier backed by the `scheduleCache` collection."""
+    def __init__(self, collection: str = 'scheduleCache', ttl_seconds: int = PERSISTENT_TTL_SECONDS):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self._db = None
+
+    def _ref(self, key: str):
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db.collection(self.collection).document(key)
+
+    def get(self, key: str) -> Optional[Dict]:
+        snap = self._ref(key).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict()
+        if time.time() - data.get('storedAt', 0) > self.ttl_seconds:
+            return None
+        return data.get('entry')
+
+    def set(self, key: str, entry: Dict):
+        self._ref(key).set({'entry': entry, 'storedAt': time.time()})
+
+class ScheduleCache:
+    """
+    In-process LRU of generated schedules in front of an optional persistent
+    store. Entries hold the schedule as team1/team2 player IDs plus the
+    search metadata; match IDs are re-issued on every hit because bets are
+    keyed by match ID.
+    """
+    def __init__(self, max_entries: int = 256, store: Optional[FirestoreScheduleStore] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._materialize(entry)
+
+        if self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                print(f"Schedule cache store read failed: {e}")
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                self.persistent_hits += 1
+                return self._materialize(entry)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, matches: List[Dict], meta: Optional[Dict] = None):
+        entry = {
+            'matches': [{'team1': list(m['team1']), 'team2': list(m['team2'])} for m in matches],
+            'meta': meta or {}
+        }
+        self._remember(key, entry)
+        if self.store is not None:
+            try:
+                self.store.set(key, entry)
+            except Exception as e:
+                print(f"Schedule cache store write failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'persistentHits': self.persistent_hits,
+            'misses': self.misses,
+            'size': len(self._entries)
+        }
+
+    def _remember(self, key: str, entry: Dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _materialize(self, entry: Dict) -> Dict:
+        matches = [
+            {'id': str(uuid.uuid4()), 'team1': list(m['team1']), 'team2': list(m['team2'])}
+            for m in entry['matches']
+        ]
+        return {'matches': matches, 'meta': dict(entry.get('meta', {}))}
@@ -0,0 +1,201 @@
+from firebase_functions import firestore_fn
+from firebase_admin import firestore
+import random
+import time
+import uuid
+from collections import Counter
+
+from tools import scheduler, schedule_cache
+
+# Wait this long after a roster change before computing, so bursts of joins
+# only trigger one search (the latest write wins)
+DEBOUNCE_SECONDS = 5
+DRAFT_TIME_BUDGET_MS = 4000
+REFINE_TIME_BUDGET_MS = 1000
+# Repair the previous draft instead of searching again if at most this many
+# players joined and at most this many left
+MAX_REUSE_CHANGES = 2
+
+# Drafts also go into the schedule cache so generate_schedule returns them instantly
+_draft_cache = schedule_cache.ScheduleCache(max_entries=64, store=schedule_cache.FirestoreScheduleStore())
+
+# Initialize Firestore Client Lazily
+_db = None
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = firestore.client()
+    return _db
+
+def draft_ref(db, session_id, mode):
+    # One draft per mode (the mode is picked when generating, not stored on
+    # the session); lives in a subcollection, so writing it does not
+    # re-trigger this function
+    return db.collection("sessions").document(session_id).collection("drafts").document(mode)
+
+def get_draft(session_id, mode, key):
+    """
+    The session's draft for `mode` as {matches, meta}, if it was computed
+    for the roster and ratings behind `key` (a default-options
+    schedule_cache.canonical_key); otherwise None. Match IDs are issued
+    fresh, as for cache hits, because bets are keyed by match ID.
+    """
+    db = get_db()
+    snap = draft_ref(db, session_id, mode).get()
+    if not snap.exists:
+        return None
+    draft = snap.to_dict()
+    if draft.get("key") != key:
+        return None
+    matches = [
+        {"id": str(uuid.uuid4()), "team1": list(m["team1"]), "team2": list(m["team2"])}
+        for m in draft.get("matches", [])
+    ]
+    return {"matches": matches, "meta": dict(draft.get("meta") or {})}
+
+@firestore_fn.on_document_written(document="sessions/{sessionId}")
+def precompute_schedule_draft(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    """
+    Precomputes a draft schedule per mode whenever a session's roster
+    changes, so generating the schedule later is instant whichever mode the
+    organizer picks.
+    """
+    db = get_db()
+    session_id = event.params["sessionId"]
+    before = event.data.before
+    after = event.data.after
+
+    if not after.exists:
+        for mode in scheduler.MODES:
+            draft_ref(db, session_id, mode).delete()
+        return
+
+    session = after.to_dict()
+    roster = sorted(session.get("players", []))
+    old_roster = sorted(before.to_dict().get("players", [])) if before.exists else []
+
+    # 1. Only roster changes on sessions that still need a schedule
+    if roster == old_roster or len(roster) < 4:
+        return
+    if session.get("matches") or session.get("status") == "COMPLETED":
+        return
+
+    # 2. Debounce: if the roster moved on while we waited, a later event handles it
+    time.sleep(DEBOUNCE_SECONDS)
+    latest = db.collection("sessions").document(session_id).get()
+    if not latest.exists or sorted(latest.to_dict().get("players", [])) != roster:
+        print(f"Draft for {session_id} superseded by a newer roster change.")
+        return
+
+    # 3. Fetch Ratings
+    player_docs = db.get_all([db.collection("players").document(pid) for pid in roster])
+    players = [{**d.to_dict(), "id": d.id} for d in player_docs if d.exists]
+    games_per_player = session.get("gamesPerPlayer") or 4
+
+    for mode in scheduler.MODES:
+        # 4. Repair the previous draft if only a couple of players changed, otherwise search
+        previous = draft_ref(db, session_id, mode).get()
+        previous = previous.to_dict() if previous.exists else None
+        result = None
+        if previous and previous.get("gamesPerPlayer") == games_per_player:
+            result = repair_draft(previous, players, games_per_player, mode)
+
+        reused = result is not None
+        if result is None:
+            result = scheduler.generate_schedule(
+                players, games_per_player, mode, time_budget_ms=DRAFT_TIME_BUDGET_MS
+            )
+
+        # 5. Save (only if the roster still matches what we scheduled)
+        latest = db.collection("sessions").document(session_id).get()
+        if not latest.exists or sorted(latest.to_dict().get("players", [])) != roster:
+            print(f"Draft for {session_id} discarded; roster changed during search.")
+            return
+
+        # generate_schedule serves the draft for this session while the key
+        # (roster and rating buckets) still matches
+        key = schedule_cache.canonical_key(players, games_per_player, mode)
+        draft_ref(db, session_id, mode).set({
+            "players": roster,
+            "gamesPerPlayer": games_per_player,
+            "mode": mode,
+            "key": key,
+            "matches": result.matches,
+            "meta": result.meta(),
+            "reused": reused,
+            "updatedAt": firestore.SERVER_TIMESTAMP
+        })
+        # Only a complete search can stand in for a default request from
+        # other sessions; a repair or a search cut off by the budget stays a draft
+        if not reused and result.stop_reason != "deadline":
+            _draft_cache.put(key, result.matches, result.meta())
+        print(f"Draft for {session_id} ({mode}): {len(result.matches)} matches, "
+              f"penalty {result.penalty:.0f}, reused={reused}")
+
+def repair_draft(previous, players, games_per_player, mode):
+    """
+    Reuses the previous draft after a few players joined or left: newcomers
+    take over leavers' slots, matches of any extra leavers are dropped, and
+    the rest are packed into rounds for the new roster size. Each round is
+    then topped up from the players sitting it out, those furthest short of
+    games_per_player first, and the local search polishes the result.
+    Returns None if nothing or too much changed, in which case the caller
+    searches from scratch.
+    """
+    old_roster = set(previous.get("players", []))
+    new_roster = {p["id"] for p in players}
+    removed = sorted(old_roster - new_roster)
+    added = sorted(new_roster - old_roster)
+    if not (removed or added) or max(len(removed), len(added)) > MAX_REUSE_CHANGES:
+        return None
+
+    # 1. Newcomers take over leavers' slots in random order
+    random.shuffle(added)
+    substitute = dict(zip(removed, added))
+    leavers = set(removed[len(added):])
+    kept = [
+        [substitute.get(pid, pid) for pid in m["team1"] + m["team2"]]
+        for m in previous.get("matches", [])
+    ]
+    kept = [m for m in kept if not leavers.intersection(m)]
+
+    # 2. Pack into rounds of n // 4 disjoint matches (the local search relies on it)
+    per_round = max(1, len(new_roster) // 4)
+    total = len(new_roster) * games_per_player // 4
+    sizes = [min(per_round, total - start) for start in range(0, total, per_round)]
+    rounds = []
+    for m in kept:
+        for r in rounds:
+            if len(r) < per_round and not any(set(m).intersection(o) for o in r):
+                r.append(m)
+                break
+        else:
+            rounds.append([m])
+    if len(rounds) > len(sizes) or any(len(r) > size for r, size in zip(rounds, sizes)):
+        return None
+    rounds += [[] for _ in range(len(sizes) - len(rounds))]
+
+    # 3. Fill each round from those sitting out, neediest first (ties at random)
+    need = {pid: games_per_player for pid in new_roster}
+    for m in kept:
+        for pid in m:
+            need[pid] -= 1
+    for r, size in zip(rounds, sizes):
+        while len(r) < size:
+            playing = {pid for m in r for pid in m}
+            m = sorted(new_roster - playing, key=lambda pid: (-need[pid], random.random()))[:4]
+            for pid in m:
+                need[pid] -= 1
+            r.append(m)
+
+    matches = [{"team1": m[:2], "team2": m[2:]} for r in rounds for m in r]
+    result = scheduler.refine_schedule(
+        players, matches, games_per_player, mode, time_budget_ms=REFINE_TIME_BUDGET_MS
+    )
+
+    # A fresh search never leaves games more than one apart; don't settle for less
+    games = Counter(pid for m in result.matches for pid in m["team1"] + m["team2"])
+    if max(games.values()) - min(games[pid] for pid in new_roster) > 1:
+        return None
+    return result
@@ -1,9 +1,21 @@
+import os
+import json
+import heapq
 import random
 import uuid
 import math
+import time
+import cProfile
+import io
+import pstats
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from operator import itemgetter
 from dataclasses import dataclass, field
 from typing import List, Dict, Set, Optional
 
+import numpy as np
+
 # --- Configuration & Constants ---
 
 MODES = {
@@ -25,7 +37,59 @@ MODES = {
     }
 }
 
-@dataclass
+MISSING_GAME_PENALTY = 50000
+
+# Greedy restarts per search. A time budget caps the latency, so a budgeted
+# search may run up to BUDGETED_ITERATIONS and stop at the deadline.
+DEFAULT_ITERATIONS = 500
+BUDGETED_ITERATIONS = 2000
+
+# Restarts are split into fixed-size chunks with their own derived seeds, so a
+# seeded search returns the same schedule whatever the worker count.
+RESTART_CHUNK_SIZE = 250
+
+# Local search (simulated annealing) applied to the best greedy schedules
+LOCAL_SEARCH_STARTS = 4
+LOCAL_SEARCH_STEPS_PER_MATCH = 150
+LOCAL_SEARCH_END_TEMPERATURE = 1.0
+
+# Share of a time budget given to greedy restarts before refinement starts
+GREEDY_BUDGET_SHARE = 0.6
+
+# Randomized groupings tried per round by the streaming generator
+ROUND_RESTARTS = 8
+
+# Large events are split into rating pods of about this many players, each
+# scheduled on its own with a smaller restart budget
+POD_SIZE = 16
+POD_ITERATIONS = 500
+
+# Functions listed in the optional cProfile report
+PROFILE_TOP_FUNCTIONS = 25
+
+# Precomputed round structures, generated by build_schedule_templates.py
+TEMPLATES_PATH = os.path.join(os.path.dirname(__file__), 'schedule_templates.json')
+
+@lru_cache(maxsize=1)
+def _load_templates() -> Dict[str, Dict]:
+    try:
+        with open(TEMPLATES_PATH) as f:
+            return json.load(f).get('templates', {})
+    except (OSError, ValueError):
+        return {}
+
+def get_schedule_template(player_count: int, games_per_player: int) -> Optional[List[tuple]]:
+    """
+    Returns the template for a roster size as (a, b, c, d) slot tuples, laid
+    out round by round with player_count // 4 matches per round, or None.
+    Every template has zero repeat partners.
+    """
+    template = _load_templates().get(f"{player_count}x{games_per_player}")
+    if not template:
+        return None
+    return [tuple(m) for m in template['matches']]
+
+@dataclass(slots=True)
 class Player:
     id: str
     hiddenRanking: float = 35.0 # Default rating if missing
@@ -42,148 +106,1143 @@ class MatchConfig:
     mode: str
     games_per_player: int
 
+@dataclass
+class ScheduleResult:
+    matches: List[Dict]
+    penalty: float
+    iterations: int
+    elapsed_ms: float
+    stop_reason: str # 'iterations', 'deadline', 'target', 'optimal', 'template', 'refined', 'pods' or 'rounds'
+    lower_bound: float = 0.0
+    proven_optimal: bool = False
+    diagnostics: Optional[Dict] = None
+
+    def meta(self) -> Dict:
+        return {
+            'penalty': self.penalty,
+            'iterations': self.iterations,
+            'elapsedMs': round(self.elapsed_ms, 1),
+            'stopReason': self.stop_reason,
+            'lowerBound': self.lower_bound,
+            'provenOptimal': self.proven_optimal
+        }
+
+class PairHistory:
+    """
+    Sparse partner/opponent counts carried across sessions, keyed by the
+    sorted pair of player IDs. Only pairs that have actually met are stored,
+    so a season of history stays small however large the league is.
+    """
+    def __init__(self, partners: Optional[Dict[tuple, int]] = None, opponents: Optional[Dict[tuple, int]] = None):
+        self.partners = partners or {}
+        self.opponents = opponents or {}
+
+    @staticmethod
+    def _key(a: str, b: str) -> tuple:
+        return (a, b) if a <= b else (b, a)
+
+    def add_match(self, match: Dict):
+        t1, t2 = match.get('team1', []), match.get('team2', [])
+        for team in (t1, t2):
+            if len(team) == 2:
+                key = self._key(team[0], team[1])
+                self.partners[key] = self.partners.get(key, 0) + 1
+        for x in t1:
+            for y in t2:
+                key = self._key(x, y)
+                self.opponents[key] = self.opponents.get(key, 0) + 1
+
+    def add_matches(self, matches: List[Dict]):
+        for m in matches:
+            self.add_match(m)
+
+    def restricted_to(self, player_ids) -> 'PairHistory':
+        """Only the pairs where both players are in `player_ids`."""
+        ids = set(player_ids)
+        return PairHistory(
+            {k: c for k, c in self.partners.items() if k[0] in ids and k[1] in ids},
+            {k: c for k, c in self.opponents.items() if k[0] in ids and k[1] in ids}
+        )
+
+    def copy(self) -> 'PairHistory':
+        return PairHistory(dict(self.partners), dict(self.opponents))
+
+@dataclass
+class SearchStats:
+    """Counters collected while searching; see generate_schedule(diagnostics=True)."""
+    restarts: int = 0
+    dead_ends: int = 0
+    fallback_fills: int = 0
+    third_player_rejections: int = 0
+    fourth_player_rejections: int = 0
+    fast_path_picks: int = 0
+    local_search_steps: int = 0
+    local_search_accepted: int = 0
+    # Greedy building, including the evaluator updates it makes as it goes
+    construction_ms: float = 0.0
+    # Simulated annealing after construction
+    local_search_ms: float = 0.0
+
+    def merge(self, other: 'SearchStats'):
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_dict(self) -> Dict:
+        return {
+            'restarts': self.restarts,
+            'deadEnds': self.dead_ends,
+            'fallbackFills': self.fallback_fills,
+            'thirdPlayerRejections': self.third_player_rejections,
+            'fourthPlayerRejections': self.fourth_player_rejections,
+            'fastPathPicks': self.fast_path_picks,
+            'localSearchSteps': self.local_search_steps,
+            'localSearchAccepted': self.local_search_accepted,
+            'constructionMs': round(self.construction_ms, 1),
+            'localSearchMs': round(self.local_search_ms, 1)
+        }
+
+class ScheduleEvaluator:
+    """
+    Running partner/opponent/games counts for a schedule, with the total
+    penalty kept current. Adding, removing or swapping a match only touches
+    the 6 pairs and 4 players involved, so deltas are O(1) instead of the
+    O(P^2) walk a full re-evaluation needs.
+
+    Players are addressed by their dense index in `scheduler.players`;
+    partner/opponent counts live in flat n*n lists that are restored in
+    place by reset() so repeated iterations do not reallocate them.
+
+    If the scheduler carries fixed `history` matches, reset() restores the
+    counts those matches produce instead of zeros. Only games and pairs of
+    players on the current roster are counted, and the skill penalty of
+    history matches is left out since no search can change it. Pairs from a
+    `pair_history` (earlier sessions) are counted the same way but add no
+    games.
+    """
+    def __init__(self, scheduler: 'Scheduler'):
+        self.scheduler = scheduler
+        self.config = scheduler.config
+        self.games_per_player = scheduler.games_per_player
+        self.index = scheduler.index
+        self.n = len(scheduler.players)
+
+        n = self.n
+        self.partners = [0] * (n * n)
+        self.opponents = [0] * (n * n)
+        self.games = [0] * n
+        self._seed_history(scheduler.history, scheduler.pair_history)
+        self.reset()
+
+    def _seed_history(self, history: List[Dict], pair_history: Optional[PairHistory] = None):
+        n = self.n
+        partners = [0] * (n * n)
+        opponents = [0] * (n * n)
+        games = [0] * n
+
+        for m in history:
+            t1 = [self.index.get(pid) for pid in m.get('team1', [])]
+            t2 = [self.index.get(pid) for pid in m.get('team2', [])]
+            for p in t1 + t2:
+                if p is not None:
+                    games[p] += 1
+            for team in (t1, t2):
+                if len(team) == 2 and None not in team:
+                    partners[team[0] * n + team[1]] += 1
+                    partners[team[1] * n + team[0]] += 1
+            for x in t1:
+                for y in t2:
+                    if x is not None and y is not None:
+                        opponents[x * n + y] += 1
+                        opponents[y * n + x] += 1
+
+        if pair_history is not None:
+            for counts, (a_id, b_id), c in (
+                [(partners, k, c) for k, c in pair_history.partners.items()]
+                + [(opponents, k, c) for k, c in pair_history.opponents.items()]
+            ):
+                a, b = self.index.get(a_id), self.index.get(b_id)
+                if a is not None and b is not None:
+                    counts[a * n + b] += c
+                    counts[b * n + a] += c
+
+        self._base_partners = partners
+        self._base_opponents = opponents
+        self._base_games = games
+        self._base_total = self._full_total(partners, opponents, games)
+
+    def _full_total(self, partners: List[int], opponents: List[int], games: List[int]) -> float:
+        # O(n^2) walk over every ordered pair, as in the original evaluator
+        cfg = self.config
+        repeat_opp = cfg.get('repeatOpponent') or 0
+        n = self.n
+        total = 0
+        for g in games:
+            if g < self.games_per_player:
+                total += (self.games_per_player - g) * MISSING_GAME_PENALTY
+        for i in range(n):
+            for j in range(n):
+                if i == j:
+                    continue
+                pc = partners[i * n + j]
+                if pc == 0:
+                    total += cfg['missedPartner']
+                elif pc > 1:
+                    total += (pc - 1) * cfg['repeatPartner']
+                oc = opponents[i * n + j]
+                if oc == 0:
+                    total += cfg['missedOpponent']
+                elif oc > 1:
+                    total += (oc - 1) * repeat_opp
+        return total
+
+    def reset(self):
+        self.partners[:] = self._base_partners
+        self.opponents[:] = self._base_opponents
+        self.games[:] = self._base_games
+        self.skill_penalty = 0
+        self.total = self._base_total
+
+    def partner_count(self, a: str, b: str) -> int:
+        return self.partners[self.index[a] * self.n + self.index[b]]
+
+    def opponent_count(self, a: str, b: str) -> int:
+        return self.opponents[self.index[a] * self.n + self.index[b]]
+
+    # --- Pair / game cost deltas ---
+
+    def _pair_delta(self, count: int, sign: int, missed: float, repeat: float) -> float:
+        # Cost of a pair seen c times: missed if c == 0, (c - 1) * repeat otherwise.
+        # Doubled because both ordered directions are penalized.
+        if sign > 0:
+            step = -missed if count == 0 else repeat
+        else:
+            step = missed if count == 1 else -repeat
+        return 2 * step
+
+    def _game_delta(self, games: int, sign: int) -> float:
+        if sign > 0:
+            return -MISSING_GAME_PENALTY if games < self.games_per_player else 0
+        return MISSING_GAME_PENALTY if games <= self.games_per_player else 0
+
+    def match_delta(self, a: int, b: int, c: int, d: int, sign: int = 1) -> float:
+        """Cost change of adding (sign=1) or removing (sign=-1) match ab vs cd."""
+        return self._relation_delta(a, b, c, d, sign) + sign * self.scheduler._skill_penalty_idx(a, b, c, d)
+
+    def _relation_delta(self, a: int, b: int, c: int, d: int, sign: int) -> float:
+        # Games + partner/opponent part of the delta (everything but skill)
+        cfg = self.config
+        repeat_opp = cfg.get('repeatOpponent') or 0
+        n = self.n
+        games = self.games
+        partners = self.partners
+        opponents = self.opponents
+        pair_delta = self._pair_delta
+
+        delta = (
+            self._game_delta(games[a], sign) + self._game_delta(games[b], sign)
+            + self._game_delta(games[c], sign) + self._game_delta(games[d], sign)
+        )
+
+        delta += pair_delta(partners[a * n + b], sign, cfg['missedPartner'], cfg['repeatPartner'])
+        delta += pair_delta(partners[c * n + d], sign, cfg['missedPartner'], cfg['repeatPartner'])
+
+        for x in (a, b):
+            for y in (c, d):
+                delta += pair_delta(opponents[x * n + y], sign, cfg['missedOpponent'], repeat_opp)
+        return delta
+
+    def apply(self, a: int, b: int, c: int, d: int, sign: int = 1) -> float:
+        """Adds (sign=1) or removes (sign=-1) match ab vs cd and returns the delta."""
+        skill = sign * self.scheduler._skill_penalty_idx(a, b, c, d)
+        delta = self._relation_delta(a, b, c, d, sign) + skill
+        n = self.n
+        games = self.games
+        partners = self.partners
+        opponents = self.opponents
+
+        games[a] += sign
+        games[b] += sign
+        games[c] += sign
+        games[d] += sign
+        partners[a * n + b] += sign
+        partners[b * n + a] += sign
+        partners[c * n + d] += sign
+        partners[d * n + c] += sign
+        for x in (a, b):
+            for y in (c, d):
+                opponents[x * n + y] += sign
+                opponents[y * n + x] += sign
+
+        self.skill_penalty += skill
+        self.total += delta
+        return delta
+
+    # --- Match dict API ---
+
+    def _indices(self, match: Dict):
+        idx = self.index
+        t1, t2 = match['team1'], match['team2']
+        return idx[t1[0]], idx[t1[1]], idx[t2[0]], idx[t2[1]]
+
+    def delta_add(self, match: Dict) -> float:
+        return self.match_delta(*self._indices(match), 1)
+
+    def delta_remove(self, match: Dict) -> float:
+        return self.match_delta(*self._indices(match), -1)
+
+    def delta_swap(self, old: Dict, new: Dict) -> float:
+        """Exact cost change of replacing `old` with `new` (pairs may overlap)."""
+        old_idx = self._indices(old)
+        removed = self.apply(*old_idx, -1)
+        added = self.match_delta(*self._indices(new), 1)
+        self.apply(*old_idx, 1)
+        return removed + added
+
+    def add_match(self, match: Dict) -> float:
+        return self.apply(*self._indices(match), 1)
+
+    def remove_match(self, match: Dict) -> float:
+        return self.apply(*self._indices(match), -1)
+
+    def swap_match(self, old: Dict, new: Dict) -> float:
+        return self.remove_match(old) + self.add_match(new)
+
+def _run_restart_chunk(args):
+    """
+    Process-pool entry point: runs one seeded chunk of greedy restarts and
+    returns its best schedules unrefined; the overall best are refined
+    afterwards, one per task (see _refine_elite_schedule).
+    """
+    players_data, games_per_player, mode, iterations, seed, deadline, target, history, pair_history = args
+    scheduler = Scheduler(players_data, games_per_player, mode, seed=seed, history=history, pair_history=pair_history)
+    return scheduler._greedy_restarts(iterations, deadline, target) + (scheduler.stats,)
+
+def _refine_elite_schedule(args):
+    """
+    Process-pool entry point: local search on one elite schedule with its
+    own seed. Returns (score, schedule, stats); past the deadline the
+    schedule comes back as it was.
+    """
+    players_data, games_per_player, mode, seed, history, pair_history, score, schedule, deadline, target = args
+    scheduler = Scheduler(players_data, games_per_player, mode, seed=seed, history=history, pair_history=pair_history)
+    if schedule and (deadline is None or time.time() < deadline):
+        evaluator = ScheduleEvaluator(scheduler)
+        for m in schedule:
+            evaluator.apply(*m)
+        score, schedule = scheduler._local_search(schedule, evaluator, deadline=deadline, target=target)
+    return score, schedule, scheduler.stats
+
+def _schedule_week(args):
+    """Process-pool entry point: schedules one session of a season."""
+    players_data, games_per_player, mode, iterations, seed, time_budget_ms, pair_history = args
+    scheduler = Scheduler(players_data, games_per_player, mode, seed=seed, pair_history=pair_history)
+    if iterations:
+        scheduler.ITERATIONS = iterations
+    return scheduler.search(time_budget_ms=time_budget_ms)
+
+def _schedule_pod(args):
+    """Process-pool entry point: schedules one rating pod."""
+    players_data, games_per_player, mode, iterations, seed, time_budget_ms, history = args
+    scheduler = Scheduler(players_data, games_per_player, mode, seed=seed, history=history)
+    scheduler.ITERATIONS = iterations
+    return scheduler.search(time_budget_ms=time_budget_ms)
+
 class Scheduler:
-    def __init__(self, players_data: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL"):
+    def __init__(self, players_data: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                 seed: Optional[int] = None, history: Optional[List[Dict]] = None,
+                 pair_history: Optional[PairHistory] = None):
         self.players = [Player.from_dict(p) for p in players_data]
         self.games_per_player = games_per_player
         self.mode = mode if mode in MODES else "STRICT_SOCIAL"
         self.config = MODES[self.mode]
-        self.ITERATIONS = 500 # Reduced from JS 2000 for Python performance initially, can tune
+        self.ITERATIONS = None # None: DEFAULT_ITERATIONS, or BUDGETED_ITERATIONS with a time budget
+        self.LOCAL_SEARCH_STARTS = LOCAL_SEARCH_STARTS
+        self.USE_TEMPLATES = True
+        self.seed = seed
+        self.rng = random.Random(seed)
 
-    def generate_matches(self) -> List[Dict]:
+        # Already-played matches that count toward games and pairings but are not re-optimized
+        self.history = history or []
+        # Partner/opponent counts from earlier sessions; these add no games
+        self.pair_history = pair_history
+
+        # Dense integer indices, assigned once and used by all internal state
+        self.index = {p.id: i for i, p in enumerate(self.players)}
+        self.ratings = [p.hiddenRanking for p in self.players]
+
+        # Reset by every search()
+        self.stats = SearchStats()
+
+    def generate_matches(self, workers: int = 1, time_budget_ms: Optional[float] = None,
+                         target_penalty: Optional[float] = None) -> List[Dict]:
+        return self.search(workers, time_budget_ms, target_penalty).matches
+
+    def search(self, workers: int = 1, time_budget_ms: Optional[float] = None,
+               target_penalty: Optional[float] = None) -> ScheduleResult:
+        """
+        Runs up to ITERATIONS randomized greedy restarts, refines the best
+        ones and returns the best schedule found. Stops early once
+        `time_budget_ms` has elapsed or a schedule scores <= `target_penalty`.
+        With workers > 1 the restarts are spread over a process pool.
+        """
+        started = time.time()
+        self.stats = SearchStats()
         if not self.players or len(self.players) < 4:
-            return []
+            return ScheduleResult([], 0, 0, 0.0, 'iterations')
 
-        best_matches = []
-        best_score = float('inf')
+        deadline = started + time_budget_ms / 1000.0 if time_budget_ms else None
+        iterations = self.ITERATIONS or (BUDGETED_ITERATIONS if deadline is not None else DEFAULT_ITERATIONS)
+
+        # Nothing can beat the lower bound, so reaching it ends the search
+        lower_bound = self.penalty_lower_bound()
+        optimal_at = lower_bound + 1e-9 * max(1.0, abs(lower_bound))
+        target = optimal_at if target_penalty is None else max(target_penalty, optimal_at)
+
+        template = None
+        if self.USE_TEMPLATES and not self.history and self.pair_history is None:
+            template = get_schedule_template(len(self.players), self.games_per_player)
+
+        if template is not None:
+            # Local search time inside the fill is counted as localSearchMs, not construction
+            fill_started = time.perf_counter()
+            local_search_before = self.stats.local_search_ms
+            score, best_matches = self._fill_template(template, deadline)
+            self.stats.construction_ms += (
+                (time.perf_counter() - fill_started) * 1000.0 - (self.stats.local_search_ms - local_search_before)
+            )
+            done, reason = 0, 'template'
+        elif workers <= 1 and self.seed is None:
+            score, best_matches, done, reason = self._run_restarts(iterations, deadline, target)
+        else:
+            score, best_matches, done, reason = self._run_parallel_restarts(iterations, workers, deadline, target)
+
+        proven_optimal = score <= optimal_at
+        if proven_optimal:
+            reason = 'optimal'
+        elif reason == 'target' and target_penalty is None:
+            reason = 'iterations'
+
+        return ScheduleResult(
+            matches=self._to_match_dicts(best_matches),
+            penalty=score,
+            iterations=done,
+            elapsed_ms=(time.time() - started) * 1000.0,
+            stop_reason=reason,
+            lower_bound=lower_bound,
+            proven_optimal=proven_optimal
+        )
+
+    def _fill_template(self, template: List[tuple], deadline: Optional[float] = None):
+        """
+        Assigns real players to template slots. Partner/opponent structure is
+        fixed by the template, so only the skill term depends on who goes
+        where: STRICT_SOCIAL shuffles players in, WEIGHTED_COMPETITIVE
+        optimizes the assignment by rating and then polishes it with a short
+        local search.
+        """
+        n = len(self.players)
+        labels = list(range(n))
+        self.rng.shuffle(labels)
+
+        competitive = self.mode == "WEIGHTED_COMPETITIVE"
+        if competitive:
+            labels = self._assign_template_slots(template, labels)
+
+        schedule = [(labels[a], labels[b], labels[c], labels[d]) for a, b, c, d in template]
+        evaluator = ScheduleEvaluator(self)
+        for m in schedule:
+            evaluator.apply(*m)
+
+        if competitive and self.LOCAL_SEARCH_STARTS:
+            return self._local_search(schedule, evaluator, deadline=deadline)
+        return evaluator.total, schedule
+
+    def _assign_template_slots(self, template: List[tuple], labels: List[int]) -> List[int]:
+        # Pairwise-swap hill climbing on the skill penalty of the slot -> player map
+        n = len(labels)
+        slot_matches = [[] for _ in range(n)]
+        for k, m in enumerate(template):
+            for slot in m:
+                slot_matches[slot].append(k)
+
+        def cost(matches):
+            total = 0
+            for k in matches:
+                a, b, c, d = template[k]
+                total += self._skill_penalty_idx(labels[a], labels[b], labels[c], labels[d])
+            return total
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(n):
+                for j in range(i + 1, n):
+                    touched = set(slot_matches[i]).union(slot_matches[j])
+                    before = cost(touched)
+                    labels[i], labels[j] = labels[j], labels[i]
+                    if cost(touched) < before - 1e-9:
+                        improved = True
+                    else:
+                        labels[i], labels[j] = labels[j], labels[i]
+        return labels
 
-        for _ in range(self.ITERATIONS):
-            schedule = self._generate_single_schedule()
-            score = self._evaluate_schedule(schedule)
+    def penalty_lower_bound(self) -> float:
+        """
+        Cheap lower bound on _evaluate_schedule for any schedule of at most
+        len(players) * games_per_player // 4 matches.
+
+        A player with g games has at most g distinct partners and 2g distinct
+        opponents, and each match they play costs them at least half the skill
+        penalty to their 3 closest-rated peers. That gives a convex per-player
+        cost in g, so handing out seats one at a time to the cheapest player
+        yields the minimum over all game distributions.
+        """
+        n = len(self.players)
+        if n < 4 or self.history or self.pair_history is not None:
+            return 0.0 # The per-player argument does not account for fixed history
+
+        cfg = self.config
+        gpp = self.games_per_player
+        others = n - 1
+        repeat_opp = cfg.get('repeatOpponent') or 0
+
+        def player_cost(g):
+            return (
+                MISSING_GAME_PENALTY * max(0, gpp - g)
+                + cfg['missedPartner'] * max(0, others - g)
+                + cfg['repeatPartner'] * max(0, g - others)
+                + cfg['missedOpponent'] * max(0, others - 2 * g)
+                + repeat_opp * max(0, 2 * g - others)
+            )
+
+        # Per-game skill floor for each player
+        squared = cfg['skillVarianceType'] == 'squared'
+        skill_floor = []
+        for i, r in enumerate(self.ratings):
+            gaps = sorted(
+                (r - o) * (r - o) if squared else abs(r - o)
+                for j, o in enumerate(self.ratings) if j != i
+            )
+            skill_floor.append(0.5 * sum(gaps[:3]) * cfg['skillVarianceWeight'])
+
+        games = [0] * n
+        total = n * player_cost(0)
+        marginal = [(player_cost(1) - player_cost(0) + skill_floor[i], i) for i in range(n)]
+        heapq.heapify(marginal)
+
+        for _ in range(4 * (n * gpp // 4)):
+            step, i = marginal[0]
+            if step >= 0:
+                break # Marginal costs only grow, so more seats cannot help
+            total += step
+            games[i] += 1
+            g = games[i]
+            heapq.heapreplace(marginal, (player_cost(g + 1) - player_cost(g) + skill_floor[i], i))
+
+        return total
+
+    def _run_restarts(self, iterations: int, deadline: Optional[float] = None,
+                      target: Optional[float] = None):
+        """
+        Greedy restarts, then local search on the best few of them.
+        Returns (score, schedule, restarts done, stop reason).
+        """
+        elite, done, reason = self._greedy_restarts(iterations, self._greedy_deadline(deadline), target)
+        best_score, best_matches = self._refine_elite(elite, deadline, target)
+
+        if target is not None and best_score <= target:
+            reason = 'target'
+        elif deadline is not None and time.time() >= deadline:
+            reason = 'deadline'
+        return best_score, best_matches, done, reason
+
+    def _greedy_deadline(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        now = time.time()
+        return now + max(0.0, deadline - now) * GREEDY_BUDGET_SHARE
+
+    def _greedy_restarts(self, iterations: int, greedy_deadline: Optional[float] = None,
+                         target: Optional[float] = None):
+        """
+        Randomized greedy restarts only. Returns (elite, restarts done, stop
+        reason), where elite holds the best LOCAL_SEARCH_STARTS schedules as
+        (score, restart number, schedule), best first.
+        """
+        evaluator = ScheduleEvaluator(self)
+        reason = 'iterations'
+
+        # Max-heap (by negated score) of the best greedy schedules seen
+        elite = []
+        keep = max(1, self.LOCAL_SEARCH_STARTS)
+        done = 0
+        for k in range(iterations):
+            # Always finish at least one restart so there is something to return
+            if greedy_deadline is not None and done and time.time() >= greedy_deadline:
+                reason = 'deadline'
+                break
+
+            build_started = time.perf_counter()
+            evaluator.reset()
+            schedule = self._build_single_schedule(evaluator)
+            self.stats.construction_ms += (time.perf_counter() - build_started) * 1000.0
+            done += 1
+            entry = (-evaluator.total, -k, schedule)
+            if len(elite) < keep:
+                heapq.heappush(elite, entry)
+            elif entry > elite[0]:
+                heapq.heapreplace(elite, entry)
+
+            if target is not None and evaluator.total <= target:
+                reason = 'target'
+                break
+
+        self.stats.restarts += done
+        return [(-neg_score, -neg_k, schedule) for neg_score, neg_k, schedule in sorted(elite, reverse=True)], done, reason
+
+    def _refine_elite(self, elite, deadline: Optional[float] = None, target: Optional[float] = None):
+        """Local search on each elite schedule in turn; returns the best (score, schedule)."""
+        evaluator = ScheduleEvaluator(self)
+        best_score = float('inf')
+        best_matches = []
+        for entry in elite:
+            score, schedule = entry[0], entry[-1]
+            refine = (
+                self.LOCAL_SEARCH_STARTS and schedule
+                and (target is None or best_score > target)
+                and (deadline is None or time.time() < deadline)
+            )
+            if refine:
+                evaluator.reset()
+                for m in schedule:
+                    evaluator.apply(*m)
+                score, schedule = self._local_search(schedule, evaluator, deadline=deadline, target=target)
 
             if score < best_score:
                 best_score = score
                 best_matches = schedule
-        
-        return best_matches
+        return best_score, best_matches
+
+    def _run_parallel_restarts(self, iterations: int, workers: int, deadline: Optional[float] = None,
+                               target: Optional[float] = None):
+        """
+        Greedy restarts in seeded chunks (optionally on a process pool). The
+        chunks' elites are merged and only the overall best
+        LOCAL_SEARCH_STARTS are refined, so the local search work does not
+        grow with the number of chunks. Each of those is refined as its own
+        task with its own seed, on the same pool, so refinement scales with
+        the workers too and the result does not depend on how many there are.
+        """
+        # One independent seed per chunk, derived from the scheduler's seed
+        chunk_sizes = []
+        remaining = iterations
+        while remaining > 0:
+            chunk_sizes.append(min(RESTART_CHUNK_SIZE, remaining))
+            remaining -= chunk_sizes[-1]
+        seeds = [self.rng.getrandbits(64) for _ in chunk_sizes]
+        greedy_deadline = self._greedy_deadline(deadline)
+
+        players_data = [{'id': p.id, 'hiddenRanking': p.hiddenRanking} for p in self.players]
+        jobs = [
+            (players_data, self.games_per_player, self.mode, size, seed, greedy_deadline, target, self.history,
+             self.pair_history)
+            for size, seed in zip(chunk_sizes, seeds)
+        ]
+
+        results = [None] * len(jobs)
+        workers = min(workers, max(len(jobs), self.LOCAL_SEARCH_STARTS))
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            # 1. Greedy restarts, chunk by chunk
+            if pool is not None:
+                futures = {pool.submit(_run_restart_chunk, job): i for i, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    if results[i][2] == 'target':
+                        # Good enough: drop chunks that have not started yet
+                        for pending in futures:
+                            pending.cancel()
+                        break
+            else:
+                for i, job in enumerate(jobs):
+                    if i and greedy_deadline is not None and time.time() >= greedy_deadline:
+                        break
+                    results[i] = _run_restart_chunk(job)
+                    if results[i][2] == 'target':
+                        break
+
+            # 2. Merge the elites; ties go to the earliest chunk so the result does not depend on the pool
+            elite = []
+            done = 0
+            for i, r in enumerate(results):
+                if r is None:
+                    continue
+                chunk_elite, chunk_done, _, chunk_stats = r
+                elite.extend((score, i, k, schedule) for score, k, schedule in chunk_elite)
+                done += chunk_done
+                self.stats.merge(chunk_stats)
+            elite.sort(key=itemgetter(0, 1, 2))
+            elite = elite[:max(1, self.LOCAL_SEARCH_STARTS)]
+
+            # 3. Refine the overall best, one task per schedule
+            refined = [(entry[0], entry[-1], None) for entry in elite]
+            if self.LOCAL_SEARCH_STARTS:
+                refine_jobs = [
+                    (players_data, self.games_per_player, self.mode, self.rng.getrandbits(64), self.history,
+                     self.pair_history, entry[0], entry[-1], deadline, target)
+                    for entry in elite
+                ]
+                if pool is not None:
+                    refined = list(pool.map(_refine_elite_schedule, refine_jobs))
+                else:
+                    for i, job in enumerate(refine_jobs):
+                        # A refined schedule already met the target; the rest would not be picked
+                        if i and target is not None and refined[i - 1][0] <= target:
+                            refined = refined[:i]
+                            break
+                        refined[i] = _refine_elite_schedule(job)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        # 4. Reduce: the first one to meet the target, or else the best (earliest on ties)
+        for _, _, refine_stats in refined:
+            if refine_stats is not None:
+                self.stats.merge(refine_stats)
+        meeting = [r for r in refined if target is not None and r[0] <= target]
+        score, best_matches, _ = meeting[0] if meeting else min(refined, key=itemgetter(0))
+
+        reason = 'iterations'
+        if target is not None and score <= target:
+            reason = 'target'
+        elif any(r is not None and r[2] == 'deadline' for r in results) or (
+                deadline is not None and time.time() >= deadline):
+            reason = 'deadline'
+        return score, best_matches, done, reason
+
+    def _local_search(self, schedule: List[tuple], evaluator: ScheduleEvaluator, steps: Optional[int] = None,
+                      deadline: Optional[float] = None, target: Optional[float] = None,
+                      allow_byes: bool = True):
+        """
+        Simulated annealing over a schedule already loaded into `evaluator`.
+        Moves keep the round structure valid: re-pair the 4 players of a
+        match, swap two players between matches of the same round, or swap
+        a player with someone sitting out that round. Each move is scored
+        by its delta on the evaluator, never by a full re-evaluation.
+        """
+        rng = self.rng
+        n = len(self.players)
+        matches = list(schedule)
+        total_matches = len(matches)
+        per_round = max(1, n // 4)
+        if steps is None:
+            steps = LOCAL_SEARCH_STEPS_PER_MATCH * total_matches
+
+        # Players sitting out each round (candidates for bye swaps)
+        byes = []
+        for start in range(0, total_matches, per_round):
+            playing = {p for m in matches[start:start + per_round] for p in m}
+            byes.append([p for p in range(n) if p not in playing] if allow_byes else [])
+
+        apply = evaluator.apply
+        current = evaluator.total
+        best_score = current
+        best_matches = list(matches)
+
+        temperature = self._initial_temperature()
+        cooling = (LOCAL_SEARCH_END_TEMPERATURE / temperature) ** (1.0 / max(1, steps))
+
+        search_started = time.perf_counter()
+        taken = 0
+        accepted = 0
+        for step in range(steps):
+            if deadline is not None and step % 256 == 0 and time.time() >= deadline:
+                break
+            if target is not None and best_score <= target:
+                break
+
+            taken += 1
+            temperature *= cooling
+            mi = rng.randrange(total_matches)
+            old_i = matches[mi]
+            r = mi // per_round
+            round_start = r * per_round
+            round_size = min(per_round, total_matches - round_start)
+            move = rng.random()
+
+            if move < 0.25:
+                # Re-pair within the match
+                a, b, c, d = old_i
+                new_i = (a, c, b, d) if rng.random() < 0.5 else (a, d, b, c)
+                delta = apply(*old_i, -1) + apply(*new_i, 1)
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    matches[mi] = new_i
+                    current += delta
+                    accepted += 1
+                else:
+                    apply(*new_i, -1)
+                    apply(*old_i, 1)
+
+            elif move < 0.8 and round_size > 1:
+                # Swap one player between two matches of the same round
+                mj = round_start + rng.randrange(round_size - 1)
+                if mj >= mi:
+                    mj += 1
+                old_j = matches[mj]
+                si, sj = rng.randrange(4), rng.randrange(4)
+                new_i, new_j = list(old_i), list(old_j)
+                new_i[si], new_j[sj] = old_j[sj], old_i[si]
+                new_i, new_j = tuple(new_i), tuple(new_j)
+
+                delta = apply(*old_i, -1) + apply(*old_j, -1) + apply(*new_i, 1) + apply(*new_j, 1)
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    matches[mi], matches[mj] = new_i, new_j
+                    current += delta
+                    accepted += 1
+                else:
+                    apply(*new_i, -1)
+                    apply(*new_j, -1)
+                    apply(*old_i, 1)
+                    apply(*old_j, 1)
+
+            elif byes[r]:
+                # Swap a player with someone sitting out this round
+                bi = rng.randrange(len(byes[r]))
+                si = rng.randrange(4)
+                new_i = list(old_i)
+                new_i[si] = byes[r][bi]
+                new_i = tuple(new_i)
+
+                delta = apply(*old_i, -1) + apply(*new_i, 1)
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    matches[mi] = new_i
+                    byes[r][bi] = old_i[si]
+                    current += delta
+                    accepted += 1
+                else:
+                    apply(*new_i, -1)
+                    apply(*old_i, 1)
+            else:
+                continue
+
+            if current < best_score:
+                best_score = current
+                best_matches = list(matches)
+
+        self.stats.local_search_steps += taken
+        self.stats.local_search_accepted += accepted
+        self.stats.local_search_ms += (time.perf_counter() - search_started) * 1000.0
+
+        # Leave the evaluator on the best schedule rather than the last one visited
+        if best_matches != matches:
+            for m in matches:
+                apply(*m, -1)
+            for m in best_matches:
+                apply(*m, 1)
+
+        return best_score, best_matches
+
+    # --- Streaming, court-aware rounds ---
+
+    def stream_rounds(self, courts: Optional[int] = None, round_budget_ms: Optional[float] = None,
+                      first_round: int = 1, deadline: Optional[float] = None):
+        """
+        Yields one round at a time as a list of match dicts tagged with
+        'round' and 'court'. Each round is optimized against everything
+        yielded before it (plus any fixed history), so round 1 is available
+        right away and later rounds are only computed when asked for.
+
+        At most `courts` matches are played per round (default: everyone
+        plays). Who sits out is decided by fewest games played, then most
+        byes so far, so byes rotate fairly. With a `deadline` (time.time()
+        value), each round gets an equal share of the time left for the
+        rounds still to come.
+        """
+        n = len(self.players)
+        if n < 4:
+            return
+
+        per_round = n // 4 if not courts else max(1, min(int(courts), n // 4))
+        evaluator = ScheduleEvaluator(self)
+        games = evaluator.games
+        byes = [0] * n
+        round_number = first_round
+        ids = [p.id for p in self.players]
+
+        while True:
+            eligible = [i for i in range(n) if games[i] < self.games_per_player]
+            court_count = min(per_round, len(eligible) // 4)
+            if court_count == 0:
+                return
+
+            # Fair bye rotation: fewest games first, then whoever has sat out most
+            self.rng.shuffle(eligible)
+            eligible.sort(key=lambda i: (games[i], -byes[i]))
+            playing = eligible[:court_count * 4]
+            seated = set(playing)
+            for i in range(n):
+                if i not in seated:
+                    byes[i] += 1
+
+            now = time.time()
+            round_deadline = now + round_budget_ms / 1000.0 if round_budget_ms else None
+            if deadline is not None:
+                seats_left = sum(max(0, self.games_per_player - g) for g in games)
+                rounds_left = max(1, math.ceil(seats_left / (4 * court_count)))
+                share = now + max(0.0, deadline - now) / rounds_left
+                round_deadline = share if round_deadline is None else min(round_deadline, share)
+            round_matches = self._build_round(playing, court_count, evaluator, round_deadline)
+
+            yield [
+                {
+                    'id': str(uuid.uuid4()),
+                    'team1': [ids[a], ids[b]],
+                    'team2': [ids[c], ids[d]],
+                    'round': round_number,
+                    'court': court + 1
+                }
+                for court, (a, b, c, d) in enumerate(round_matches)
+            ]
+            round_number += 1
+
+    def _build_round(self, playing: List[int], court_count: int, evaluator: ScheduleEvaluator,
+                     deadline: Optional[float] = None) -> List[tuple]:
+        """
+        Splits `playing` into `court_count` matches. A few randomized greedy
+        groupings are tried, the best is refined with the local search
+        restricted to this round, and the result is left applied on
+        `evaluator`.
+        """
+        n = len(self.players)
+        partners = evaluator.partners
+        opponents = evaluator.opponents
+        best_delta = float('inf')
+        best_round = []
+
+        for _ in range(ROUND_RESTARTS):
+            if best_round and deadline is not None and time.time() >= deadline:
+                break
+
+            pool = list(playing)
+            self.rng.shuffle(pool)
+            round_matches = []
+            delta = 0
+            while len(pool) >= 4:
+                group = [pool.pop(0)]
+                while len(group) < 4:
+                    # Fewest shared partners, then opponents, with the group so far
+                    k = min(
+                        range(len(pool)),
+                        key=lambda j: sum(partners[pool[j] * n + g] * 100 + opponents[pool[j] * n + g] for g in group)
+                    )
+                    group.append(pool.pop(k))
+
+                a, b, c, d = group
+                options = [(a, b, c, d), (a, c, b, d), (a, d, b, c)]
+                match = min(options, key=lambda m: evaluator.match_delta(*m))
+                delta += evaluator.apply(*match)
+                round_matches.append(match)
+
+            # Deltas depend on the order matches were applied, so undo in reverse
+            for m in reversed(round_matches):
+                evaluator.apply(*m, -1)
+            if delta < best_delta:
+                best_delta = delta
+                best_round = round_matches
+
+        for m in best_round:
+            evaluator.apply(*m)
+
+        if self.LOCAL_SEARCH_STARTS and len(best_round) > 1:
+            _, best_round = self._local_search(best_round, evaluator, deadline=deadline, allow_byes=False)
+        return best_round
+
+    def diagnostics(self, matches: List[Dict]) -> Dict:
+        """Counters from the last search plus the penalty breakdown of `matches`."""
+        breakdown = {}
+        if matches:
+            scored = self.score_encoded(self.encode_schedules([matches]))
+            breakdown = {name: round(float(values[0]), 3) for name, values in scored.items()}
+        return {**self.stats.to_dict(), 'penalty': breakdown}
+
+    def _initial_temperature(self) -> float:
+        # Start hot enough to trade a missed opponent for a better structure
+        return 0.2 * self.config['missedOpponent']
+
+    def _to_match_dicts(self, schedule: List[tuple]) -> List[Dict]:
+        ids = [p.id for p in self.players]
+        return [
+            {
+                'id': str(uuid.uuid4()),
+                'team1': [ids[a], ids[b]],
+                'team2': [ids[c], ids[d]]
+            }
+            for a, b, c, d in schedule
+        ]
 
     def _get_match_skill_penalty(self, p1: Player, p2: Player, p3: Player, p4: Player) -> float:
-        rankings = [p1.hiddenRanking, p2.hiddenRanking, p3.hiddenRanking, p4.hiddenRanking]
-        
+        return self._skill_penalty_for(p1.hiddenRanking, p2.hiddenRanking, p3.hiddenRanking, p4.hiddenRanking)
+
+    def _skill_penalty_idx(self, a: int, b: int, c: int, d: int) -> float:
+        r = self.ratings
+        return self._skill_penalty_for(r[a], r[b], r[c], r[d])
+
+    def _skill_penalty_for(self, r1: float, r2: float, r3: float, r4: float) -> float:
         if self.config['skillVarianceType'] == 'squared':
             # Sum of squared differences
-            sum_sq_diff = 0
-            for i in range(4):
-                for j in range(i + 1, 4):
-                    diff = rankings[i] - rankings[j]
-                    sum_sq_diff += diff * diff
-            return sum_sq_diff * self.config['skillVarianceWeight']
+            d12, d13, d14 = r1 - r2, r1 - r3, r1 - r4
+            d23, d24, d34 = r2 - r3, r2 - r4, r3 - r4
+            sum_diff = d12 * d12 + d13 * d13 + d14 * d14 + d23 * d23 + d24 * d24 + d34 * d34
         else:
             # Linear variance (Social)
-            sum_diff = 0
-            for i in range(4):
-                for j in range(i + 1, 4):
-                    sum_diff += abs(rankings[i] - rankings[j])
-            return sum_diff * self.config['skillVarianceWeight']
+            sum_diff = (
+                abs(r1 - r2) + abs(r1 - r3) + abs(r1 - r4)
+                + abs(r2 - r3) + abs(r2 - r4) + abs(r3 - r4)
+            )
+        return sum_diff * self.config['skillVarianceWeight']
 
     def _evaluate_schedule(self, matches: List[Dict]) -> float:
-        # Initialize stats
-        stats = {p.id: {'partners': {}, 'opponents': {}, 'gamesPlayed': 0} for p in self.players}
-        
-        total_penalty = 0
-        skill_penalty = 0
+        evaluator = ScheduleEvaluator(self)
+        for m in matches:
+            evaluator.add_match(m)
+        return evaluator.total
 
-        player_map = {p.id: p for p in self.players}
+    # --- Vectorized batch scoring ---
 
-        for m in matches:
-            t1 = m['team1']
-            t2 = m['team2']
-            p1, p2 = player_map[t1[0]], player_map[t1[1]]
-            p3, p4 = player_map[t2[0]], player_map[t2[1]]
-
-            # Track Games
-            for pid in [p1.id, p2.id, p3.id, p4.id]:
-                stats[pid]['gamesPlayed'] += 1
-            
-            # Track Partners
-            def add_partner(a, b):
-                stats[a]['partners'][b] = stats[a]['partners'].get(b, 0) + 1
-                stats[b]['partners'][a] = stats[b]['partners'].get(a, 0) + 1
-                
-            add_partner(p1.id, p2.id)
-            add_partner(p3.id, p4.id)
-
-            # Track Opponents
-            teams = [[p1.id, p2.id], [p3.id, p4.id]]
-            for t_a in teams[0]:
-                for t_b in teams[1]:
-                    stats[t_a]['opponents'][t_b] = stats[t_a]['opponents'].get(t_b, 0) + 1
-                    stats[t_b]['opponents'][t_a] = stats[t_b]['opponents'].get(t_a, 0) + 1
-
-            skill_penalty += self._get_match_skill_penalty(p1, p2, p3, p4)
-
-        total_penalty += skill_penalty
-
-        # Global Penalties
-        for p in self.players:
-            p_stats = stats[p.id]
-            
-            # Missing Games
-            if p_stats['gamesPlayed'] < self.games_per_player:
-                total_penalty += (self.games_per_player - p_stats['gamesPlayed']) * 50000
-
-            # Relationships
-            for other in self.players:
-                if p.id == other.id:
-                    continue
-                
-                partner_count = p_stats['partners'].get(other.id, 0)
-                if partner_count == 0:
-                    total_penalty += self.config['missedPartner']
-                elif partner_count > 1:
-                    total_penalty += (partner_count - 1) * self.config['repeatPartner']
-
-                opponent_count = p_stats['opponents'].get(other.id, 0)
-                if opponent_count == 0:
-                    total_penalty += self.config['missedOpponent']
-                elif opponent_count > 1 and self.config.get('repeatOpponent'):
-                    total_penalty += (opponent_count - 1) * self.config['repeatOpponent']
-
-        return total_penalty
-
-    def _generate_single_schedule(self) -> List[Dict]:
+    def encode_schedules(self, schedules: List[List[Dict]]) -> np.ndarray:
+        """
+        Encodes schedules as a (batch, matches, 4) int array of player indices
+        laid out [team1[0], team1[1], team2[0], team2[1]]. Shorter schedules
+        are padded with -1.
+        """
+        longest = max((len(s) for s in schedules), default=0)
+        encoded = np.full((len(schedules), longest, 4), -1, dtype=np.int32)
+        idx = self.index
+        for b, schedule in enumerate(schedules):
+            for m, match in enumerate(schedule):
+                t1, t2 = match['team1'], match['team2']
+                encoded[b, m] = (idx[t1[0]], idx[t1[1]], idx[t2[0]], idx[t2[1]])
+        return encoded
+
+    def score_encoded(self, encoded: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Scores a batch of encoded schedules in one pass. Returns per-schedule
+        arrays for each penalty component plus 'total', matching
+        _evaluate_schedule up to float rounding in the skill term.
+        """
+        cfg = self.config
+        n = len(self.players)
+        batch, _, _ = encoded.shape
+        valid = encoded[:, :, 0] >= 0
+        slots = np.where(valid[:, :, None], encoded, 0).astype(np.int64)
+        offset = (np.arange(batch, dtype=np.int64) * n)[:, None]
+
+        # Games per player, (batch, n)
+        game_keys = (offset[:, :, None] + slots)[valid]
+        games = np.bincount(game_keys.ravel(), minlength=batch * n).reshape(batch, n)
+
+        # Pair count tensors, (batch, n, n), symmetric
+        def pair_counts(pairs):
+            keys = []
+            for i, j in pairs:
+                x, y = slots[:, :, i], slots[:, :, j]
+                keys.append(((offset + x) * n + y)[valid])
+                keys.append(((offset + y) * n + x)[valid])
+            flat = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+            return np.bincount(flat, minlength=batch * n * n).reshape(batch, n, n)
+
+        partners = pair_counts([(0, 1), (2, 3)])
+        opponents = pair_counts([(0, 2), (0, 3), (1, 2), (1, 3)])
+
+        # Diagonal entries are always zero and must not count as "missed"
+        missed_partner = (np.count_nonzero(partners == 0, axis=(1, 2)) - n) * cfg['missedPartner']
+        repeat_partner = np.maximum(partners - 1, 0).sum(axis=(1, 2)) * cfg['repeatPartner']
+        missed_opponent = (np.count_nonzero(opponents == 0, axis=(1, 2)) - n) * cfg['missedOpponent']
+        repeat_opponent = np.maximum(opponents - 1, 0).sum(axis=(1, 2)) * (cfg.get('repeatOpponent') or 0)
+        missing_games = np.maximum(self.games_per_player - games, 0).sum(axis=1) * MISSING_GAME_PENALTY
+
+        # Skill: same 6 pairwise differences as _get_match_skill_penalty
+        r = np.asarray(self.ratings, dtype=np.float64)[slots]
+        diffs = np.stack([r[:, :, i] - r[:, :, j] for i in range(4) for j in range(i + 1, 4)], axis=-1)
+        if cfg['skillVarianceType'] == 'squared':
+            per_match = (diffs * diffs).sum(axis=-1)
+        else:
+            per_match = np.abs(diffs).sum(axis=-1)
+        skill = np.where(valid, per_match, 0.0).sum(axis=1) * cfg['skillVarianceWeight']
+
+        breakdown = {
+            'skill': skill,
+            'missedPartner': missed_partner,
+            'repeatPartner': repeat_partner,
+            'missedOpponent': missed_opponent,
+            'repeatOpponent': repeat_opponent,
+            'missingGames': missing_games,
+        }
+        breakdown['total'] = sum(breakdown.values())
+        return breakdown
+
+    def score_schedules(self, schedules: List[List[Dict]]) -> List[float]:
+        """Vectorized equivalent of calling _evaluate_schedule on each schedule."""
+        if not schedules:
+            return []
+        return self.score_encoded(self.encode_schedules(schedules))['total'].tolist()
+
+    def _generate_single_schedule(self, evaluator: Optional[ScheduleEvaluator] = None) -> List[Dict]:
+        if evaluator is None:
+            evaluator = ScheduleEvaluator(self)
+        return self._to_match_dicts(self._build_single_schedule(evaluator))
+
+    def _build_single_schedule(self, evaluator: ScheduleEvaluator) -> List[tuple]:
+        """Randomized greedy construction; returns (a, b, c, d) index tuples for ab vs cd."""
         matches = []
-        player_stats = {p.id: {'partners': {}, 'opponents': {}, 'gamesPlayed': 0} for p in self.players}
-        
-        total_slots = len(self.players) * self.games_per_player
+
+        n = len(self.players)
+        ratings = self.ratings
+        partners = evaluator.partners
+        opponents = evaluator.opponents
+        games = evaluator.games
+        games_per_player = self.games_per_player
+
+        # Seats still to fill (everything, unless history already covers some games)
+        total_slots = sum(max(0, games_per_player - g) for g in games)
         total_matches = total_slots // 4 # Integer division
 
         current_round_matches = 0
         current_round_players = set()
-        matches_per_round = len(self.players) // 4
+        matches_per_round = n // 4
+        dead_ends = fallback_fills = third_rejections = fourth_rejections = fast_picks = 0
+
+        repeat_partner_penalty = 10000 if self.mode == "WEIGHTED_COMPETITIVE" else 20000
+        repeat_opp_penalty = self.config.get('repeatOpponent', 4000)
+
+        # Bitmask per player of who they have partnered, and of who they have
+        # met at all (partner or opponent). Counts only grow during
+        # construction, so bits are only ever set.
+        partnered = [0] * n
+        met = [0] * n
+        for i in range(n):
+            row = i * n
+            for j in range(n):
+                if partners[row + j]:
+                    partnered[i] |= 1 << j
+                    met[i] |= 1 << j
+                elif opponents[row + j]:
+                    met[i] |= 1 << j
 
         # Heuristic Helper
-        def get_heuristic_score(p1, p2, p3, p4):
-            score = 0
-            
+        def get_heuristic_score(a, b, c, d):
             # Partner Repeats
-            def check_partner(a, b): return player_stats[a.id]['partners'].get(b.id, 0)
-            
-            repeat_partner_penalty = 10000 if self.mode == "WEIGHTED_COMPETITIVE" else 20000
-            score += check_partner(p1, p2) * repeat_partner_penalty
-            score += check_partner(p3, p4) * repeat_partner_penalty
+            score = (partners[a * n + b] + partners[c * n + d]) * repeat_partner_penalty
 
             # Opponent Repeats
-            def check_opponent(a, b): return player_stats[a.id]['opponents'].get(b.id, 0)
-            repeat_opp_penalty = self.config.get('repeatOpponent', 4000)
-
-            score += check_opponent(p1, p3) * repeat_opp_penalty
-            score += check_opponent(p1, p4) * repeat_opp_penalty
-            score += check_opponent(p2, p3) * repeat_opp_penalty
-            score += check_opponent(p2, p4) * repeat_opp_penalty
+            score += (
+                opponents[a * n + c] + opponents[a * n + d]
+                + opponents[b * n + c] + opponents[b * n + d]
+            ) * repeat_opp_penalty
 
             # Skill
-            score += self._get_match_skill_penalty(p1, p2, p3, p4)
+            score += self._skill_penalty_idx(a, b, c, d)
             return score
 
         for _ in range(total_matches):
@@ -193,108 +1252,109 @@ class Scheduler:
 
             # Filter candidates
             candidates = [
-                p for p in self.players 
-                if player_stats[p.id]['gamesPlayed'] < self.games_per_player 
-                and p.id not in current_round_players
+                i for i in range(n)
+                if games[i] < games_per_player
+                and i not in current_round_players
             ]
 
             if len(candidates) < 4:
                 break
 
             # Shuffle and Sort
-            random.shuffle(candidates)
-            candidates.sort(key=lambda p: player_stats[p.id]['gamesPlayed'])
+            self.rng.shuffle(candidates)
+            candidates.sort(key=games.__getitem__)
 
             p1 = candidates[0]
             others = candidates[1:]
 
             if self.mode == "WEIGHTED_COMPETITIVE":
                 # Sort by skill proximity to p1
-                others.sort(key=lambda p: abs(p.hiddenRanking - p1.hiddenRanking))
-            
+                r1 = ratings[p1]
+                others.sort(key=lambda p: abs(ratings[p] - r1))
+
             # Greedy Builder
             match_players = [p1]
+            chosen_mask = 1 << p1
             SEARCH_WINDOW = 6
 
             while len(match_players) < 4:
                 valid_next = []
-                
+                chosen = len(match_players)
+
+                # Fast path: candidates who have never met anyone chosen so far
+                # score 0, always pass the pruning checks below and sort first
+                # in `others` order. If there are enough of them, they are
+                # exactly the window the full scoring would produce.
+                for c in others:
+                    if not (met[c] & chosen_mask) and not (chosen_mask >> c) & 1:
+                        valid_next.append(c)
+                        if len(valid_next) >= SEARCH_WINDOW:
+                            break
+
+                if len(valid_next) >= SEARCH_WINDOW:
+                    pick = self.rng.choice(valid_next)
+                    match_players.append(pick)
+                    chosen_mask |= 1 << pick
+                    fast_picks += 1
+                    continue
+                valid_next = []
+
                 # Score candidates
                 candidate_scores = []
                 for c in others:
-                    if any(mp.id == c.id for mp in match_players):
+                    if (chosen_mask >> c) & 1:
                         continue
-                        
+
+                    row = c * n
                     score = 0
                     for existing in match_players:
-                        score += player_stats[c.id]['partners'].get(existing.id, 0) * 100
-                        score += player_stats[c.id]['opponents'].get(existing.id, 0)
-                    candidate_scores.append({'player': c, 'score': score})
-                
-                candidate_scores.sort(key=lambda x: x['score'])
-
-                for item in candidate_scores:
-                    candidate = item['player']
+                        score += partners[row + existing] * 100 + opponents[row + existing]
+                    candidate_scores.append((score, c))
+
+                candidate_scores.sort(key=itemgetter(0))
+
+                for _score, candidate in candidate_scores:
                     if len(valid_next) >= SEARCH_WINDOW:
                         break
-                    
-                    if any(mp.id == candidate.id for mp in match_players):
-                        continue
 
-                    # Pruning 3rd player
-                    if len(match_players) == 2:
-                        pA, pB, pC = match_players[0], match_players[1], candidate
-                        ab_bad = player_stats[pA.id]['partners'].get(pB.id, 0) > 0
-                        ac_bad = player_stats[pA.id]['partners'].get(pC.id, 0) > 0
-                        bc_bad = player_stats[pB.id]['partners'].get(pC.id, 0) > 0
-                        
-                        if ab_bad and ac_bad and bc_bad:
+                    # Pruning 3rd player: A, B and C have all partnered each other
+                    if chosen == 2:
+                        pA, pB = match_players[0], match_players[1]
+                        if (partnered[pA] >> pB) & 1 and partnered[candidate] & chosen_mask == chosen_mask:
+                            third_rejections += 1
                             continue
-                            
-                    # Pruning 4th player (Impossible Group Check)
-                    if len(match_players) == 3:
-                        pA, pB, pC, pD = match_players[0], match_players[1], match_players[2], candidate
-                        
-                        permutations = [
-                            ((pA, pB), (pC, pD)),
-                            ((pA, pC), (pB, pD)),
-                            ((pA, pD), (pB, pC))
-                        ]
-                        
-                        has_valid_perm = False
-                        for (t1, t2) in permutations:
-                            bad1 = player_stats[t1[0].id]['partners'].get(t1[1].id, 0) > 0
-                            bad2 = player_stats[t2[0].id]['partners'].get(t2[1].id, 0) > 0
-                            if not bad1 and not bad2:
-                                has_valid_perm = True
-                                break
-                        
-                        if not has_valid_perm:
+
+                    # Pruning 4th player (Impossible Group Check): no split into
+                    # two fresh partnerships
+                    if chosen == 3:
+                        pA, pB, pC = match_players
+                        if (
+                            ((partnered[pA] >> pB) & 1 or (partnered[pC] >> candidate) & 1)
+                            and ((partnered[pA] >> pC) & 1 or (partnered[pB] >> candidate) & 1)
+                            and ((partnered[pA] >> candidate) & 1 or (partnered[pB] >> pC) & 1)
+                        ):
+                            fourth_rejections += 1
                             continue
 
-                    # Relaxed Constraint check
-                    collision_count = 0
-                    for existing in match_players:
-                        if player_stats[existing.id]['partners'].get(candidate.id, 0) > 0:
-                            collision_count += 1
-                            
-                    if collision_count < len(match_players):
+                    # Relaxed Constraint check: not partnered with everyone chosen
+                    if partnered[candidate] & chosen_mask != chosen_mask:
                         valid_next.append(candidate)
 
                 if valid_next:
-                    pick = random.choice(valid_next)
+                    pick = self.rng.choice(valid_next)
                     match_players.append(pick)
+                    chosen_mask |= 1 << pick
                 else:
+                    dead_ends += 1
                     break # Dead end
 
             # Fallback
             if len(match_players) < 4:
-                existing_ids = {p.id for p in match_players}
                 for c in others:
                     if len(match_players) >= 4: break
-                    if c.id not in existing_ids:
+                    if c not in match_players:
                         match_players.append(c)
-                        existing_ids.add(c.id)
+                        fallback_fills += 1
 
             # Find Best Permutation
             permutations = [
@@ -311,35 +1371,315 @@ class Scheduler:
                 score = get_heuristic_score(t1[0], t1[1], t2[0], t2[1])
                 if score < min_score:
                     min_score = score
-                    best_match = {'team1': t1, 'team2': t2}
+                    best_match = (t1, t2)
 
             if best_match:
-                t1 = best_match['team1']
-                t2 = best_match['team2']
-                
-                matches.append({
-                    'id': str(uuid.uuid4()),
-                    'team1': [t1[0].id, t1[1].id],
-                    'team2': [t2[0].id, t2[1].id]
-                })
-
-                # Update Stats
-                def update_stats(p, partner, opp1, opp2):
-                    player_stats[p.id]['gamesPlayed'] += 1
-                    player_stats[p.id]['partners'][partner.id] = player_stats[p.id]['partners'].get(partner.id, 0) + 1
-                    player_stats[p.id]['opponents'][opp1.id] = player_stats[p.id]['opponents'].get(opp1.id, 0) + 1
-                    player_stats[p.id]['opponents'][opp2.id] = player_stats[p.id]['opponents'].get(opp2.id, 0) + 1
-
-                update_stats(t1[0], t1[1], t2[0], t2[1])
-                update_stats(t1[1], t1[0], t2[0], t2[1])
-                update_stats(t2[0], t2[1], t1[0], t1[1])
-                update_stats(t2[1], t2[0], t1[0], t1[1])
-
-                current_round_players.update([p.id for p in t1 + t2])
+                t1, t2 = best_match
+
+                matches.append((t1[0], t1[1], t2[0], t2[1]))
+
+                # Update Stats (also keeps the running penalty current)
+                evaluator.apply(t1[0], t1[1], t2[0], t2[1])
+                a, b, c, d = t1[0], t1[1], t2[0], t2[1]
+                partnered[a] |= 1 << b
+                partnered[b] |= 1 << a
+                partnered[c] |= 1 << d
+                partnered[d] |= 1 << c
+                group = (1 << a) | (1 << b) | (1 << c) | (1 << d)
+                for p in (a, b, c, d):
+                    met[p] |= group & ~(1 << p)
+
+                current_round_players.update(t1 + t2)
                 current_round_matches += 1
 
+        stats = self.stats
+        stats.dead_ends += dead_ends
+        stats.fallback_fills += fallback_fills
+        stats.third_player_rejections += third_rejections
+        stats.fourth_player_rejections += fourth_rejections
+        stats.fast_path_picks += fast_picks
         return matches
 
-def generate_matches(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL") -> List[Dict]:
-    scheduler = Scheduler(players, games_per_player, mode)
-    return scheduler.generate_matches()
+def generate_matches(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                     iterations: Optional[int] = None, workers: int = 1, seed: Optional[int] = None) -> List[Dict]:
+    return generate_schedule(players, games_per_player, mode, iterations, workers, seed).matches
+
+def reschedule_matches(players: List[Dict], existing_matches: List[Dict], games_per_player: int = 4,
+                       mode: str = "STRICT_SOCIAL", iterations: Optional[int] = None, workers: int = 1,
+                       seed: Optional[int] = None, time_budget_ms: Optional[float] = None) -> ScheduleResult:
+    """
+    Re-optimizes only the unplayed part of a session for a (possibly changed)
+    roster. Scored matches are kept as fixed history: they seed games played
+    and partner/opponent counts, and the result holds only the new matches
+    that replace the unplayed ones.
+    """
+    history = [m for m in existing_matches if is_scored(m)]
+    scheduler = Scheduler(players, games_per_player, mode, seed=seed, history=history)
+    if iterations:
+        scheduler.ITERATIONS = iterations
+    return scheduler.search(workers=min(workers, os.cpu_count() or 1), time_budget_ms=time_budget_ms)
+
+def stream_rounds(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                  courts: Optional[int] = None, history: Optional[List[Dict]] = None,
+                  seed: Optional[int] = None, round_budget_ms: Optional[float] = None,
+                  first_round: int = 1):
+    """Generator over court-aware rounds; see Scheduler.stream_rounds."""
+    scheduler = Scheduler(players, games_per_player, mode, seed=seed, history=history)
+    return scheduler.stream_rounds(courts=courts, round_budget_ms=round_budget_ms, first_round=first_round)
+
+def plan_rounds(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                courts: Optional[int] = None, seed: Optional[int] = None,
+                time_budget_ms: Optional[float] = None) -> ScheduleResult:
+    """
+    A whole court plan from stream_rounds, as one ScheduleResult. With
+    `time_budget_ms`, rounds share the budget and building stops once it is
+    spent (round 1 is always built); stop_reason is then 'deadline' and the
+    remaining rounds can be added later, e.g. with next_round.
+    """
+    started = time.time()
+    scheduler = Scheduler(players, games_per_player, mode, seed=seed)
+    deadline = started + time_budget_ms / 1000.0 if time_budget_ms else None
+
+    matches = []
+    rounds = 0
+    reason = 'rounds'
+    for round_matches in scheduler.stream_rounds(courts=courts, deadline=deadline):
+        matches.extend(round_matches)
+        rounds += 1
+        if deadline is not None and time.time() >= deadline:
+            reason = 'deadline'
+            break
+
+    lower_bound = scheduler.penalty_lower_bound()
+    penalty = scheduler._evaluate_schedule(matches) if matches else 0.0
+    return ScheduleResult(
+        matches, penalty, rounds, (time.time() - started) * 1000.0, reason,
+        lower_bound, bool(matches) and penalty <= lower_bound + 1e-9 * max(1.0, abs(lower_bound))
+    )
+
+def refine_schedule(players: List[Dict], matches: List[Dict], games_per_player: int = 4,
+                    mode: str = "STRICT_SOCIAL", seed: Optional[int] = None,
+                    time_budget_ms: Optional[float] = None) -> ScheduleResult:
+    """
+    Polishes an existing schedule for `players` with the local search
+    instead of starting over, e.g. after swapping a player in. Match order
+    is taken as the round structure.
+    """
+    started = time.time()
+    scheduler = Scheduler(players, games_per_player, mode, seed=seed)
+    index = scheduler.index
+    schedule = [
+        (index[m['team1'][0]], index[m['team1'][1]], index[m['team2'][0]], index[m['team2'][1]])
+        for m in matches
+    ]
+    evaluator = ScheduleEvaluator(scheduler)
+    for m in schedule:
+        evaluator.apply(*m)
+
+    deadline = started + time_budget_ms / 1000.0 if time_budget_ms else None
+    score, schedule = scheduler._local_search(schedule, evaluator, deadline=deadline) if schedule else (evaluator.total, schedule)
+    return ScheduleResult(
+        scheduler._to_match_dicts(schedule), score, 0, (time.time() - started) * 1000.0, 'refined'
+    )
+
+def is_scored(match: Dict) -> bool:
+    return match.get('team1Score') is not None and match.get('team2Score') is not None
+
+def generate_schedule(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                      iterations: Optional[int] = None, workers: int = 1, seed: Optional[int] = None,
+                      time_budget_ms: Optional[float] = None,
+                      target_penalty: Optional[float] = None,
+                      use_templates: bool = True, diagnostics: bool = False,
+                      profile: bool = False) -> ScheduleResult:
+    """
+    With `diagnostics`, the result carries search counters and a penalty
+    breakdown of the returned schedule. `profile` additionally runs the
+    search under cProfile and includes the top functions by cumulative time.
+    """
+    scheduler = Scheduler(players, games_per_player, mode, seed=seed)
+    if iterations:
+        scheduler.ITERATIONS = iterations
+    scheduler.USE_TEMPLATES = use_templates
+
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    result = scheduler.search(
+        workers=min(workers, os.cpu_count() or 1),
+        time_budget_ms=time_budget_ms,
+        target_penalty=target_penalty
+    )
+    if profiler is not None:
+        profiler.disable()
+
+    if diagnostics or profile:
+        result.diagnostics = scheduler.diagnostics(result.matches)
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            result.diagnostics['profile'] = out.getvalue()
+    return result
+
+# --- Large events ---
+
+def partition_pods(players: List[Dict], pod_size: int = POD_SIZE, offset: bool = False) -> List[List[Dict]]:
+    """
+    Splits the roster, sorted by rating, into contiguous pods of roughly
+    `pod_size`. With `offset` the pod boundaries move by half a pod, so
+    players near a boundary land with their other neighbours.
+    """
+    ranked = sorted(players, key=lambda p: -Player.from_dict(p).hiddenRanking)
+    n = len(ranked)
+    k = max(1, min(round(n / pod_size), n // 4))
+    bounds = [round(i * n / k) for i in range(k + 1)]
+    if offset and k == 2:
+        # No inner pod to cut: cut both pods through the middle, so the
+        # middle pod straddles the one boundary and the halves stand alone
+        bounds = [0, bounds[1] // 2, (bounds[1] + n) // 2, n]
+    elif offset:
+        # Cut through the middle of every inner pod; the two end pods absorb the halves
+        bounds = [0] + [(bounds[i] + bounds[i + 1]) // 2 for i in range(1, k - 1)] + [n]
+    # Inner boundaries on multiples of 4 so only the last pod can have byes
+    bounds = [0] + [4 * round(b / 4) for b in bounds[1:-1]] + [n]
+    pods = [ranked[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1) if bounds[i + 1] > bounds[i]]
+    if len(pods) > 1 and len(pods[-1]) < 4:
+        pods[-2] = pods[-2] + pods.pop()
+    return pods
+
+def assign_rounds(matches: List[Dict], first_round: int = 1) -> int:
+    """
+    Tags matches in place with 'round' and 'court': each match goes in the
+    earliest round none of its players are already in. Returns the next free
+    round number.
+    """
+    rounds = []
+    busy = []
+    for m in matches:
+        seated = set(m['team1'] + m['team2'])
+        r = 0
+        while r < len(rounds) and busy[r] & seated:
+            r += 1
+        if r == len(rounds):
+            rounds.append([])
+            busy.append(set())
+        rounds[r].append(m)
+        busy[r] |= seated
+
+    for r, round_matches in enumerate(rounds):
+        for court, m in enumerate(round_matches):
+            m['round'] = first_round + r
+            m['court'] = court + 1
+    return first_round + len(rounds)
+
+def generate_large_event(players: List[Dict], games_per_player: int = 4, mode: str = "STRICT_SOCIAL",
+                         pod_size: int = POD_SIZE, rotate: bool = True, iterations: int = POD_ITERATIONS,
+                         workers: int = 1, seed: Optional[int] = None,
+                         time_budget_ms: Optional[float] = None) -> ScheduleResult:
+    """
+    Schedules a large roster as independent rating pods, so the work grows
+    linearly with the number of players instead of with its square.
+
+    With `rotate`, the games are split into two phases. The second phase
+    re-partitions with boundaries offset by half a pod and is scheduled
+    against the first phase's matches. Pods within a phase run in parallel
+    on up to `workers` processes. `time_budget_ms` applies to each pod.
+    The returned matches are stitched into one court plan tagged with
+    'round' and 'court'. The reported penalty is the sum of each pod's own
+    objective.
+    """
+    start_time = time.time()
+    workers = min(max(1, workers), os.cpu_count() or 1)
+    rng = random.Random(seed)
+
+    phase_games = [games_per_player]
+    if rotate and games_per_player > 1 and len(players) >= 2 * pod_size:
+        phase_games = [(games_per_player + 1) // 2, games_per_player // 2]
+
+    matches = []
+    penalty = 0.0
+    total_iterations = 0
+    lower_bound = 0.0
+    next_round = 1
+    for phase, games in enumerate(phase_games):
+        pods = partition_pods(players, pod_size, offset=phase > 0)
+        # Later phases are scheduled against earlier ones, so targets are cumulative
+        target_games = sum(phase_games[:phase + 1])
+        jobs = [
+            (pod, target_games, mode, iterations, rng.getrandbits(64) if seed is not None else None,
+             time_budget_ms, matches)
+            for pod in pods
+        ]
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_schedule_pod, jobs))
+        else:
+            results = [_schedule_pod(job) for job in jobs]
+
+        phase_matches = []
+        for result in results:
+            phase_matches.extend(result.matches)
+            penalty += result.penalty
+            total_iterations += result.iterations
+            lower_bound += result.lower_bound
+        next_round = assign_rounds(phase_matches, next_round)
+        matches.extend(phase_matches)
+
+    return ScheduleResult(
+        matches, penalty, total_iterations, (time.time() - start_time) * 1000, 'pods', lower_bound, False
+    )
+
+# --- League seasons ---
+
+def generate_season(weeks: List[Dict], mode: str = "STRICT_SOCIAL", history: Optional[PairHistory] = None,
+                    iterations: Optional[int] = None, workers: int = 1, seed: Optional[int] = None,
+                    time_budget_ms: Optional[float] = None) -> Dict[str, ScheduleResult]:
+    """
+    Schedules a run of sessions in date order so pairs from earlier weeks
+    count as repeats later on. `weeks` is a list of
+    {id, players, gamesPerPlayer}; `history` seeds the counts, e.g. from
+    completed sessions.
+
+    A week only depends on earlier weeks it shares at least two players
+    with (otherwise no pair can carry over), so weeks are grouped into
+    waves that run in parallel on up to `workers` processes.
+    Returns {week id: ScheduleResult}.
+    """
+    workers = min(max(1, workers), os.cpu_count() or 1)
+    rng = random.Random(seed)
+    history = history or PairHistory()
+    rosters = [{p['id'] for p in week['players']} for week in weeks]
+    seeds = [rng.getrandbits(64) if seed is not None else None for _ in weeks]
+
+    # Wave = 1 + latest wave of any earlier week with an overlapping pair
+    waves = []
+    for j in range(len(weeks)):
+        waves.append(1 + max(
+            (waves[i] for i in range(j) if len(rosters[i] & rosters[j]) >= 2), default=-1
+        ))
+
+    results = {}
+    for wave in range(max(waves, default=-1) + 1):
+        indices = [j for j in range(len(weeks)) if waves[j] == wave]
+        jobs = []
+        for j in indices:
+            # Every earlier week that shares a pair with this one is already done
+            week_history = history.restricted_to(rosters[j])
+            for i in range(j):
+                done = results.get(weeks[i]['id'])
+                if done is not None:
+                    week_history.add_matches(done.matches)
+            jobs.append((
+                weeks[j]['players'], weeks[j].get('gamesPerPlayer') or 4, mode, iterations,
+                seeds[j], time_budget_ms, week_history.restricted_to(rosters[j])
+            ))
+
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                wave_results = list(pool.map(_schedule_week, jobs))
+        else:
+            wave_results = [_schedule_week(job) for job in jobs]
+
+        for j, result in zip(indices, wave_results):
+            results[weeks[j]['id']] = result
+
+    return results
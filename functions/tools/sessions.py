@@ -1,14 +1,41 @@
 from firebase_admin import firestore
 from google.cloud import firestore as google_firestore
-from tools import ratings, betting
+from google.api_core import exceptions as google_exceptions
+from tools import ratings, betting, scheduler, court_queue, oddsmaker, rating_history, settlement_journal
 import datetime
+import os
+
+# Firestore caps 'array-contains-any' at 30 values per query
+ARRAY_QUERY_LIMIT = 30
+# Set by the server whenever it saves priced matches; complete_session only
+# re-prices sessions with this status
+OPEN_STATUS = 'OPEN'
+# reschedule_session searches again if the session changed during the search
+RESCHEDULE_RETRIES = 2
+
+# Warm instances keep each open-play queue in memory between calls; the
+# revision stored on the session tells us whether it is still current
+_court_queues = {}
 
 def get_db():
     return firestore.client()
 
+def fetch_players(player_ids):
+    """The saved player documents (with 'id') for these IDs, in order; unknown IDs are skipped."""
+    db = get_db()
+    player_docs = db.get_all([db.collection('players').document(pid) for pid in dict.fromkeys(player_ids)])
+    players_by_id = {d.id: {**d.to_dict(), 'id': d.id} for d in player_docs if d.exists}
+    return [players_by_id[pid] for pid in player_ids if pid in players_by_id]
+
 def complete_session(session_id):
     """
     Completes a session: Updates ratings, resolves bets, marks complete.
+
+    Each phase is recorded in the session's settlement journal, so a retry
+    (or a second run racing this one) skips finished phases and only
+    re-reads what is left: the ratings are applied exactly once, history
+    appends are idempotent, and bets are settled per match with one
+    idempotency key per wallet credit.
     """
     db = get_db()
     session_ref = db.collection('sessions').document(session_id)
@@ -18,17 +45,87 @@ def complete_session(session_id):
         return {"error": "Session not found"}
     
     session = session_doc.to_dict()
+    journal = settlement_journal.load(db, session_id)
+    if settlement_journal.is_done(journal, 'status'):
+        return {"success": True, "message": "Session already completed"}
+    # Completed before the journal existed: everything was already applied
+    if not journal.exists and session.get('status') == 'COMPLETED':
+        return {"success": True, "message": "Session already completed"}
 
     matches = session.get('matches', [])
+    scored_matches = [m for m in matches if m.get('team1Score') is not None and m.get('team2Score') is not None]
+    unplayed_matches = [m for m in matches if m.get('team1Score') is None or m.get('team2Score') is None]
+
+    # 1-3. Ratings (once)
+    if not settlement_journal.is_done(journal, 'ratings'):
+        journal = _apply_session_ratings(db, session_id, matches, scored_matches, journal)
+        if journal is None:
+            return {"message": "No players in session, marked complete."}
+
+    # 3a. Re-price Other Open Sessions (idempotent, from the saved ratings)
+    if not settlement_journal.is_done(journal, 'spreads'):
+        player_ids = {pid for m in matches for pid in m.get('team1', []) + m.get('team2', [])}
+        repriced = _reprice_open_sessions(db, player_ids, session_id)
+        settlement_journal.mark(db, session_id, 'spreads')
+        print(f"Re-priced {repriced} open sessions.")
+
+    # 3b. Append to Rating History (idempotent per session)
+    if not settlement_journal.is_done(journal, 'history'):
+        appended = rating_history.append_session(
+            db, session_id, rating_history.session_time(session), settlement_journal.unpack_points(journal)
+        )
+        settlement_journal.mark(db, session_id, 'history')
+        print(f"Rating history appended for {appended} players.")
+
+    # 4. Resolve Bets (scored) and Refund Bets (unplayed), skipping settled matches
+    phases = [
+        (phase, field, phase_matches)
+        for phase, field, phase_matches in (('bets', 'settledMatches', scored_matches),
+                                            ('refunds', 'refundedMatches', unplayed_matches))
+        if not settlement_journal.is_done(journal, phase)
+    ]
+    # One query for both phases; each phase settles its own share of it
+    open_bets = betting.fetch_open_bets(db, session_id) if phases else []
+    unfinished = []
+    for phase, field, phase_matches in phases:
+        done = set(settlement_journal.done_matches(journal, field))
+        todo = [m for m in phase_matches if m.get('id') not in done]
+        todo_ids = {m.get('id') for m in todo}
+        phase_bets = [b for b in open_bets if b.to_dict().get('matchId') in todo_ids]
+        result = betting.settle_session_bets(db, session_id, todo, phase_bets) if todo else {"unsettled": 0}
+        if result["unsettled"]:
+            unfinished.append(phase)
+            continue
+        settlement_journal.mark(db, session_id, phase, {
+            field: firestore.ArrayUnion([m['id'] for m in todo if m.get('id')])
+        })
+
+    if unfinished:
+        return {"error": f"Could not settle all {' and '.join(unfinished)}; retry to finish completing the session"}
+
+    # 5. Mark Complete (with the journal, in one batch)
+    batch = db.batch()
+    batch.update(session_ref, {'status': 'COMPLETED'})
+    settlement_journal.mark(db, session_id, 'status', {'completedAt': firestore.SERVER_TIMESTAMP}, batch=batch)
+    batch.commit()
     
+    return {"success": True, "message": "Session completed"}
+
+def _apply_session_ratings(db, session_id, matches, scored_matches, journal):
+    """
+    Applies the session's rating updates and claims the journal's ratings
+    phase in the same batch. If another run claimed it first, its journal
+    is returned instead and nothing is written. Returns None when the
+    session has no players.
+    """
     # 1. Fetch Players
     player_ids = set()
     for m in matches:
         player_ids.update(m.get('team1', []))
         player_ids.update(m.get('team2', []))
-    
+
     if not player_ids:
-        return {"message": "No players in session, marked complete."}
+        return None
 
     # Batch get players
     # chunking if needed (omitted for brevity, usually < 30 players)
@@ -38,11 +135,10 @@ def complete_session(session_id):
     players_map = {d.id: {**d.to_dict(), 'id': d.id} for d in player_docs if d.exists}
     
     # 2. Process Matches (Sequential Rating Updates)
-    scored_matches = [m for m in matches if m.get('team1Score') is not None and m.get('team2Score') is not None]
-    unplayed_matches = [m for m in matches if m.get('team1Score') is None or m.get('team2Score') is None]
-
     print(f"Processing {len(scored_matches)} scored matches for ratings...")
 
+    # Rating after each match, per player, for the history
+    history_points = {}
     for match in scored_matches:
         t1_players = [players_map[pid] for pid in match.get('team1', []) if pid in players_map]
         t2_players = [players_map[pid] for pid in match.get('team2', []) if pid in players_map]
@@ -52,28 +148,103 @@ def complete_session(session_id):
         # Update local map
         for p in updated_players:
             players_map[p['id']] = p
+            history_points.setdefault(p['id'], []).append((match.get('id'), p.get('hiddenRating', ratings.DEFAULT_RATING)))
 
-    # 3. Save Ratings
+    # 3. Save Ratings (and claim the phase, in the same batch)
     batch = db.batch()
     for pid, p_data in players_map.items():
         # Only update hiddenRating/hiddenRanking
         ref = db.collection('players').document(pid)
         batch.update(ref, {'hiddenRating': p_data.get('hiddenRating', 35.0)})
 
-    batch.commit()
-    print("Ratings saved.")
+    settlement_journal.claim(batch, db, session_id, journal, 'ratings', {
+        'historyPoints': settlement_journal.pack_points(history_points)
+    })
+    try:
+        batch.commit()
+        print("Ratings saved.")
+    except (google_exceptions.FailedPrecondition, google_exceptions.Conflict) as e:
+        print(f"Session {session_id}: ratings already claimed by another run ({e}).")
+    return settlement_journal.load(db, session_id)
 
-    # 4. Resolve Bets
-    for match in scored_matches:
-        betting.resolve_bets_for_match(db, match['id'], int(match['team1Score']), int(match['team2Score']))
-    
-    for match in unplayed_matches:
-        betting.refund_bets_for_match(db, match['id'])
+def _reprice_open_sessions(db, player_ids, exclude_session_id):
+    """
+    Re-prices the unplayed matches of every other open session these
+    players are in, from the ratings currently saved. Each session is
+    updated in its own transaction, so scores saved in the meantime are
+    never overwritten. Open bets keep the spread they were placed at, so
+    only future bets see the new odds.
 
-    # 5. Mark Complete
-    session_ref.update({'status': 'COMPLETED'})
-    
-    return {"success": True, "message": "Session completed"}
+    Re-pricing is best-effort: if the query fails (e.g. the composite
+    index from firestore.indexes.json is not deployed yet), nothing is
+    re-priced and completion carries on.
+    """
+    # 1. Find Open Sessions With Unplayed Matches
+    player_ids = sorted(player_ids)
+    sessions_by_id = {}
+    try:
+        for i in range(0, len(player_ids), ARRAY_QUERY_LIMIT):
+            chunk = player_ids[i:i + ARRAY_QUERY_LIMIT]
+            query = db.collection('sessions') \
+                .where(filter=firestore.FieldFilter('status', '==', OPEN_STATUS)) \
+                .where(filter=firestore.FieldFilter('players', 'array_contains_any', chunk))
+            for doc in query.stream():
+                session = doc.to_dict()
+                if doc.id != exclude_session_id and any(not scheduler.is_scored(m) for m in session.get('matches', [])):
+                    sessions_by_id[doc.id] = session
+    except Exception as e:
+        print(f"Could not query open sessions to re-price: {e}")
+        return 0
+
+    if not sessions_by_id: return 0
+
+    # 2. Fetch Ratings for Everyone in Those Matches
+    others = sorted({
+        pid for session in sessions_by_id.values() for m in session.get('matches', [])
+        for pid in m.get('team1', []) + m.get('team2', [])
+    })
+    player_docs = db.get_all([db.collection('players').document(pid) for pid in others])
+    ratings_by_id = {d.id: d.to_dict() for d in player_docs if d.exists}
+
+    # 3. Re-price (one transaction per session)
+    repriced = 0
+    for session_id in sessions_by_id:
+        session_ref = db.collection('sessions').document(session_id)
+        try:
+            result = _reprice_transaction(db.transaction(), db, session_ref, ratings_by_id)
+            if result is not None and result[1]:
+                repriced += 1
+        except Exception as e:
+            print(f"Could not re-price session {session_id}: {e}")
+    return repriced
+
+@firestore.transactional
+def _reprice_transaction(transaction, db, session_ref, ratings_by_id, open_only=True):
+    """
+    Re-prices the session's unplayed matches as they are inside the
+    transaction. Returns (matches, changed), or None when the session is
+    missing (or, with open_only, not OPEN).
+    """
+    session_snap = session_ref.get(transaction=transaction)
+    if not session_snap.exists: return None
+    session = session_snap.to_dict()
+    if open_only and session.get('status') != OPEN_STATUS: return None
+
+    # Anyone not fetched yet (e.g. substituted in since the query was run)
+    matches = session.get('matches', [])
+    ratings_by_id = dict(ratings_by_id)
+    missing = sorted({
+        pid for m in matches if not scheduler.is_scored(m)
+        for pid in m.get('team1', []) + m.get('team2', []) if pid not in ratings_by_id
+    })
+    if missing:
+        player_docs = db.get_all([db.collection('players').document(pid) for pid in missing], transaction=transaction)
+        ratings_by_id.update({d.id: d.to_dict() for d in player_docs if d.exists})
+
+    updated_matches = oddsmaker.refresh_unplayed_spreads(matches, ratings_by_id)
+    if updated_matches == matches: return matches, False
+    transaction.update(session_ref, {'matches': updated_matches})
+    return updated_matches, True
 
 def join_session(session_id, player_id):
     db = get_db()
@@ -201,13 +372,311 @@ def substitute_player(session_id, old_player_id, new_player_id):
             new_m['team2'] = [new_player_id if pid == old_player_id else pid for pid in m.get('team2', [])]
         updated_matches.append(new_m)
         
-    # 5. Update Players List
+    # 5. Re-price Unplayed Matches for the New Lineup
+    player_ids = {pid for m in updated_matches for pid in m.get('team1', []) + m.get('team2', [])}
+    player_docs = db.get_all([db.collection('players').document(pid) for pid in player_ids])
+    ratings_by_id = {d.id: d.to_dict() for d in player_docs if d.exists}
+    updated_matches = oddsmaker.refresh_unplayed_spreads(updated_matches, ratings_by_id)
+
+    # 6. Update Players List
     new_players_list = [new_player_id if pid == old_player_id else pid for pid in players]
     
-    # 6. Save
+    # 7. Save
     session_ref.update({
         'matches': updated_matches,
         'players': new_players_list
     })
     
     return {"success": True}
+
+def _open_fields(session):
+    """Marks a session the server just priced as open (completed sessions stay completed)."""
+    return {} if session.get('status') == 'COMPLETED' else {'status': OPEN_STATUS}
+
+def save_schedule(session_id, matches):
+    """
+    Saves a generated (and already priced) schedule as the session's
+    matches. Refused once any match is scored; use reschedule_session then.
+    Bets on the matches it replaces are refunded.
+    """
+    db = get_db()
+    session_ref = db.collection('sessions').document(session_id)
+
+    try:
+        replaced = _save_schedule_transaction(db.transaction(), session_ref, matches)
+    except Exception as e:
+        return {"error": str(e)}
+
+    for match in replaced:
+        betting.refund_bets_for_match(db, match['id'])
+    return {"success": True}
+
+@firestore.transactional
+def _save_schedule_transaction(transaction, session_ref, matches):
+    session_snap = session_ref.get(transaction=transaction)
+    if not session_snap.exists: raise Exception("Session not found")
+    session = session_snap.to_dict()
+
+    if session.get('status') == 'COMPLETED': raise Exception("Session is already completed")
+    existing = session.get('matches', [])
+    if any(scheduler.is_scored(m) for m in existing):
+        raise Exception("Session already has scores; use reschedule_session instead")
+
+    transaction.update(session_ref, {'matches': matches, **_open_fields(session)})
+    return [m for m in existing if m.get('id')]
+
+def reschedule_session(session_id, mode="STRICT_SOCIAL"):
+    """
+    Regenerates only the unplayed matches of a session for its current roster.
+    Scored matches are kept as-is and seed the partner/opponent history.
+
+    The save only applies if the session is unchanged since it was read, so
+    a score entered during the search is never dropped; the search then
+    runs again from the new state (up to RESCHEDULE_RETRIES times). Bets on
+    the replaced matches are refunded once the save has committed.
+    """
+    db = get_db()
+    session_ref = db.collection('sessions').document(session_id)
+
+    for attempt in range(RESCHEDULE_RETRIES + 1):
+        # 1. Fetch Session
+        session_doc = session_ref.get()
+        if not session_doc.exists: return {"error": "Session not found"}
+        session = session_doc.to_dict()
+
+        matches = session.get('matches', [])
+        roster = session.get('players', [])
+        games_per_player = session.get('gamesPerPlayer') or 4
+
+        if len(roster) < 4: return {"error": "At least 4 players are required."}
+
+        # 2. Fetch Ratings
+        player_refs = [db.collection('players').document(pid) for pid in roster]
+        player_docs = db.get_all(player_refs)
+        players = [{**d.to_dict(), 'id': d.id} for d in player_docs if d.exists]
+
+        # 3. Re-optimize Unplayed Matches
+        played = [m for m in matches if scheduler.is_scored(m)]
+        dropped = [m for m in matches if not scheduler.is_scored(m)]
+        result = scheduler.reschedule_matches(players, matches, games_per_player, mode)
+
+        # 4. Save (only if nothing changed during the search)
+        updated_matches = played + oddsmaker.apply_spreads(result.matches, {p['id']: p for p in players})
+        try:
+            session_ref.update({'matches': updated_matches, **_open_fields(session)},
+                               option=db.write_option(last_update_time=session_doc.update_time))
+            break
+        except google_exceptions.FailedPrecondition:
+            print(f"Session {session_id} changed while rescheduling; searching again.")
+    else:
+        return {"error": "Session kept changing while rescheduling; try again"}
+
+    # 5. Refund Bets on Replaced Matches
+    for match in dropped:
+        betting.refund_bets_for_match(db, match['id'])
+
+    return {"success": True, "matches": updated_matches, "meta": result.meta()}
+
+def recalculate_spreads(session_id):
+    """
+    Re-prices a session's unplayed matches from the players' current
+    ratings, in a transaction so a score saved meanwhile is kept.
+    """
+    db = get_db()
+    session_ref = db.collection('sessions').document(session_id)
+
+    try:
+        result = _reprice_transaction(db.transaction(), db, session_ref, {}, open_only=False)
+    except Exception as e:
+        return {"error": str(e)}
+    if result is None: return {"error": "Session not found"}
+
+    return {"success": True, "matches": result[0]}
+
+def next_round(session_id, courts=None, mode="STRICT_SOCIAL"):
+    """
+    Generates the next round for the courts that are free right now and
+    appends it to the session. Every existing match counts as history, so
+    the round is optimized against what has already been scheduled.
+    """
+    db = get_db()
+    session_ref = db.collection('sessions').document(session_id)
+
+    # 1. Fetch Session
+    session_doc = session_ref.get()
+    if not session_doc.exists: return {"error": "Session not found"}
+    session = session_doc.to_dict()
+
+    matches = session.get('matches', [])
+    roster = session.get('players', [])
+    games_per_player = session.get('gamesPerPlayer') or 4
+
+    if len(roster) < 4: return {"error": "At least 4 players are required."}
+
+    # 2. Fetch Ratings
+    player_refs = [db.collection('players').document(pid) for pid in roster]
+    player_docs = db.get_all(player_refs)
+    players = [{**d.to_dict(), 'id': d.id} for d in player_docs if d.exists]
+
+    # 3. Build One Round (untagged matches, e.g. from generate_schedule, fill rounds of their own first)
+    untagged = [dict(m) for m in matches if not m.get('round')]
+    untagged_rounds = scheduler.assign_rounds(untagged) - 1
+    first_round = max([m.get('round') or 0 for m in matches] + [untagged_rounds]) + 1
+    rounds = scheduler.stream_rounds(
+        players, games_per_player, mode, courts=courts, history=matches, first_round=first_round
+    )
+    round_matches = next(rounds, None)
+    if not round_matches:
+        return {"error": "Every player has already reached gamesPerPlayer."}
+    round_matches = oddsmaker.apply_spreads(round_matches, {p['id']: p for p in players})
+
+    # 4. Save
+    session_ref.update({'matches': firestore.ArrayUnion(round_matches), **_open_fields(session)})
+
+    return {"success": True, "round": first_round, "matches": round_matches}
+
+def court_ready(session_id, court, team1_score=None, team2_score=None, mode="STRICT_SOCIAL"):
+    """
+    Open play: `court` just freed up. Records the score of the match that
+    was on it (if given), puts those players back in line and starts the
+    next match on that court.
+    """
+    db = get_db()
+    session_ref = db.collection('sessions').document(session_id)
+
+    # Each transaction attempt mutates its own copy; the warm queue is only
+    # replaced once a commit succeeds
+    cached = _court_queues.pop(session_id, None)
+    try:
+        match, queue, revision = _court_ready_transaction(
+            db.transaction(), db, session_ref, cached, court, team1_score, team2_score, mode
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+    _court_queues[session_id] = (revision, queue)
+    return {"success": True, "match": match, "waiting": queue.waiting_count()}
+
+@firestore.transactional
+def _court_ready_transaction(transaction, db, session_ref, cached, court, team1_score, team2_score, mode):
+    session_snap = session_ref.get(transaction=transaction)
+    if not session_snap.exists: raise Exception("Session not found")
+    session = session_snap.to_dict()
+
+    matches = session.get('matches', [])
+    roster = session.get('players', [])
+    state = session.get('courtQueue') or {}
+    revision = state.get('revision', 0)
+
+    # 1. Reuse (a copy of) the warm queue if nothing changed since we last saved it
+    queue = None
+    if cached is not None and cached[0] == revision and sorted(cached[1].ids) == sorted(roster):
+        queue = cached[1].copy()
+    else:
+        player_refs = [db.collection('players').document(pid) for pid in roster]
+        player_docs = db.get_all(player_refs, transaction=transaction)
+        players = [{**d.to_dict(), 'id': d.id} for d in player_docs if d.exists]
+        queue = court_queue.CourtQueue.from_session(
+            players, matches, session.get('gamesPerPlayer') or 4, mode,
+            ready_at=state.get('readyAt'), courts=state.get('courts')
+        )
+
+    # 2. Finish whatever was on the court
+    finished = queue.finish_match(court)
+    if finished is not None and team1_score is not None and team2_score is not None:
+        for m in matches:
+            if m.get('id') == finished['id']:
+                m['team1Score'] = team1_score
+                m['team2Score'] = team2_score
+                break
+
+    # 3. Start the next match
+    match = queue.next_match(court)
+    if match is not None:
+        ratings_by_id = {p.id: {'hiddenRating': p.hiddenRanking} for p in queue.scheduler.players}
+        match = oddsmaker.apply_spreads([match], ratings_by_id)[0]
+        queue.courts[court] = match
+        matches.append(match)
+
+    revision += 1
+    transaction.update(session_ref, {
+        'matches': matches,
+        'courtQueue': {
+            'revision': revision,
+            'readyAt': queue.ready_times(),
+            'courts': {str(c): m['id'] for c, m in queue.courts.items()}
+        },
+        **_open_fields(session)
+    })
+    return match, queue, revision
+
+def schedule_league(league_id, mode="STRICT_SOCIAL", seed_from_completed=True, overwrite=False,
+                    workers=None):
+    """
+    Generates schedules for every upcoming session of a league in one go,
+    so partners and opponents rotate across weeks. Completed sessions
+    (optionally) seed the pair history. Sessions that already have matches
+    are left alone unless overwrite is set; sessions with scores are never
+    touched. Independent weeks run on up to `workers` processes (default:
+    every CPU).
+    """
+    db = get_db()
+
+    # 1. Fetch League Sessions
+    query = db.collection('sessions').where(filter=firestore.FieldFilter('leagueId', '==', league_id))
+    docs = list(query.stream())
+    if not docs: return {"error": "No sessions found for league"}
+
+    history = scheduler.PairHistory()
+    upcoming = []
+    for doc in docs:
+        session = doc.to_dict()
+        matches = session.get('matches', [])
+        if session.get('status') == 'COMPLETED' or any(scheduler.is_scored(m) for m in matches):
+            if seed_from_completed:
+                history.add_matches([m for m in matches if scheduler.is_scored(m)])
+            continue
+        if matches and not overwrite:
+            continue
+        if len(session.get('players', [])) < 4:
+            continue
+        upcoming.append((doc.id, session))
+
+    if not upcoming: return {"success": True, "scheduled": {}}
+
+    # Week order matters: earlier weeks become history for later ones
+    upcoming.sort(key=lambda item: rating_history.session_time(item[1]))
+
+    # 2. Fetch Ratings (once for the whole league)
+    player_ids = sorted({pid for _, session in upcoming for pid in session.get('players', [])})
+    player_docs = db.get_all([db.collection('players').document(pid) for pid in player_ids])
+    ratings_by_id = {d.id: {**d.to_dict(), 'id': d.id} for d in player_docs if d.exists}
+
+    weeks = [
+        {
+            'id': session_id,
+            'players': [ratings_by_id[pid] for pid in session.get('players', []) if pid in ratings_by_id],
+            'gamesPerPlayer': session.get('gamesPerPlayer') or 4
+        }
+        for session_id, session in upcoming
+    ]
+
+    # 3. Generate
+    results = scheduler.generate_season(weeks, mode, history=history, workers=workers or os.cpu_count() or 1)
+
+    # 4. Refund Bets on Replaced Matches
+    for session_id, session in upcoming:
+        for match in session.get('matches', []):
+            betting.refund_bets_for_match(db, match['id'])
+
+    # 5. Save
+    batch = db.batch()
+    for session_id, _ in upcoming:
+        matches = oddsmaker.apply_spreads(results[session_id].matches, ratings_by_id)
+        batch.update(db.collection('sessions').document(session_id), {'matches': matches, 'status': OPEN_STATUS})
+    batch.commit()
+
+    return {
+        "success": True,
+        "scheduled": {session_id: results[session_id].meta() for session_id, _ in upcoming}
+    }
@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional
+
+from firebase_admin import firestore
+
+# The phases of complete_session, in the order they run
+PHASES = ('ratings', 'spreads', 'history', 'bets', 'refunds', 'status')
+
+def get_db():
+    return firestore.client()
+
+def journal_ref(db, session_id: str):
+    """sessions/{sessionId}/journal/settlement: which completion phases are done."""
+    return db.collection('sessions').document(session_id).collection('journal').document('settlement')
+
+def load(db, session_id: str):
+    """The journal snapshot (check .exists); a missing journal means nothing is done yet."""
+    return journal_ref(db, session_id).get()
+
+def is_done(snap, phase: str) -> bool:
+    return bool(snap.exists and (snap.to_dict().get('phases') or {}).get(phase))
+
+def done_matches(snap, field: str) -> List[str]:
+    """Match IDs already settled ('settledMatches') or refunded ('refundedMatches')."""
+    return list(snap.to_dict().get(field, [])) if snap.exists else []
+
+def pack_points(points: Dict[str, List[tuple]]) -> Dict[str, Dict]:
+    """History points as parallel lists, since Firestore cannot nest arrays."""
+    return {
+        pid: {'matchIds': [m for m, _ in pts], 'ratings': [float(r) for _, r in pts]}
+        for pid, pts in points.items()
+    }
+
+def unpack_points(snap) -> Dict[str, List[tuple]]:
+    packed = snap.to_dict().get('historyPoints', {}) if snap.exists else {}
+    return {pid: list(zip(p.get('matchIds', []), p.get('ratings', []))) for pid, p in packed.items()}
+
+def claim(batch, db, session_id: str, snap, phase: str, fields: Optional[Dict] = None):
+    """
+    Queues the journal write for `phase` on a batch that also holds the
+    phase's own writes. The write only applies if the journal is unchanged
+    since `snap` was read (or still missing), so when two runs race, one
+    batch commits and the other fails as a whole.
+    """
+    data = {**(fields or {}), f'phases.{phase}': firestore.SERVER_TIMESTAMP}
+    ref = journal_ref(db, session_id)
+    if snap.exists:
+        batch.update(ref, data, option=db.write_option(last_update_time=snap.update_time))
+    else:
+        batch.create(ref, {
+            'sessionId': session_id,
+            'phases': {phase: firestore.SERVER_TIMESTAMP},
+            **(fields or {}),
+            'createdAt': firestore.SERVER_TIMESTAMP
+        })
+
+def mark(db, session_id: str, phase: str, fields: Optional[Dict] = None, batch=None):
+    """
+    Records a phase whose own writes are idempotent, so no precondition is
+    needed. With a batch, the write is queued instead of applied.
+    """
+    data = {'sessionId': session_id, 'phases': {phase: firestore.SERVER_TIMESTAMP}, **(fields or {})}
+    ref = journal_ref(db, session_id)
+    if batch is not None:
+        batch.set(ref, data, merge=True)
+    else:
+        ref.set(data, merge=True)
@@ -0,0 +1,238 @@
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from tools.scheduler import Scheduler, ScheduleEvaluator, MISSING_GAME_PENALTY
+
+# Scoring sessions kept per warm instance; clients resend the schedule on a miss
+MAX_SESSIONS = 128
+
+class WhatIfSession:
+    """
+    A schedule loaded once into the Scheduler's penalty model so that hand
+    edits can be re-scored incrementally. Each edit only re-counts the pairs
+    and games of the (at most 8) players it touches, and the double-booking
+    check only re-walks the rounds it touches.
+
+    Rounds are consecutive chunks of players // 4 matches, the same as
+    src/utils/scheduleValidator.js.
+    """
+    def __init__(self, players: List[Dict], matches: List[Dict], games_per_player: int = 4,
+                 mode: str = "STRICT_SOCIAL"):
+        self.scheduler = Scheduler(players, games_per_player, mode)
+        self.evaluator = ScheduleEvaluator(self.scheduler)
+        self.ids = [p.id for p in self.scheduler.players]
+        self.n = len(self.ids)
+        self.per_round = max(1, self.n // 4)
+
+        index = self.scheduler.index
+        self.match_ids = []
+        self.matches = []
+        for m in matches:
+            slots = [index.get(pid) for pid in list(m['team1']) + list(m['team2'])]
+            if None in slots or len(slots) != 4:
+                raise ValueError(f"Match {m.get('id')} has players that are not on the roster")
+            self.match_ids.append(m.get('id') or str(uuid.uuid4()))
+            self.matches.append(tuple(slots))
+        for match in self.matches:
+            self.evaluator.apply(*match)
+
+        # Penalty components, kept current by every edit
+        self.breakdown = {
+            'skill': 0.0, 'missedPartner': 0.0, 'repeatPartner': 0.0,
+            'missedOpponent': 0.0, 'repeatOpponent': 0.0, 'missingGames': 0.0
+        }
+        self.repeat_partners = {}
+        self.repeat_opponents = {}
+        self._count(range(self.n), 1)
+        for match in self.matches:
+            self.breakdown['skill'] += self.scheduler._skill_penalty_idx(*match)
+
+        self.double_bookings = {}
+        for r in range((len(self.matches) + self.per_round - 1) // self.per_round):
+            self._check_round(r)
+
+    # --- Incremental bookkeeping ---
+
+    def _count(self, players, sign: int):
+        """Adds (sign=1) or removes (sign=-1) the pair and game terms among `players`."""
+        cfg = self.scheduler.config
+        repeat_opp = cfg.get('repeatOpponent') or 0
+        n = self.n
+        partners = self.evaluator.partners
+        opponents = self.evaluator.opponents
+        games = self.evaluator.games
+        gpp = self.scheduler.games_per_player
+        b = self.breakdown
+
+        players = sorted(set(players))
+        for p in players:
+            if games[p] < gpp:
+                b['missingGames'] += sign * (gpp - games[p]) * MISSING_GAME_PENALTY
+
+        for k, i in enumerate(players):
+            for j in players[k + 1:]:
+                # Both ordered directions are penalized, as in the evaluator
+                pc = partners[i * n + j]
+                if pc == 0:
+                    b['missedPartner'] += sign * 2 * cfg['missedPartner']
+                elif pc > 1:
+                    b['repeatPartner'] += sign * 2 * (pc - 1) * cfg['repeatPartner']
+                oc = opponents[i * n + j]
+                if oc == 0:
+                    b['missedOpponent'] += sign * 2 * cfg['missedOpponent']
+                elif oc > 1:
+                    b['repeatOpponent'] += sign * 2 * (oc - 1) * repeat_opp
+
+                if sign > 0:
+                    if pc > 1:
+                        self.repeat_partners[(i, j)] = pc
+                    if oc > 1:
+                        self.repeat_opponents[(i, j)] = oc
+                else:
+                    self.repeat_partners.pop((i, j), None)
+                    self.repeat_opponents.pop((i, j), None)
+
+    def _check_round(self, r: int):
+        start = r * self.per_round
+        seen = set()
+        duplicates = set()
+        for match in self.matches[start:start + self.per_round]:
+            for p in match:
+                if p in seen:
+                    duplicates.add(p)
+                seen.add(p)
+        if duplicates:
+            self.double_bookings[r] = sorted(duplicates)
+        else:
+            self.double_bookings.pop(r, None)
+
+    def _replace(self, changes: Dict[int, tuple]):
+        """Swaps in new player tuples for the given match positions."""
+        affected = set()
+        for pos, new in changes.items():
+            if len(set(new)) != 4:
+                raise ValueError("A player cannot appear twice in the same match")
+            affected.update(self.matches[pos])
+            affected.update(new)
+
+        self._count(affected, -1)
+        for pos, new in changes.items():
+            old = self.matches[pos]
+            self.evaluator.apply(*old, -1)
+            self.breakdown['skill'] -= self.scheduler._skill_penalty_idx(*old)
+            self.matches[pos] = new
+        for pos, new in changes.items():
+            self.evaluator.apply(*new)
+            self.breakdown['skill'] += self.scheduler._skill_penalty_idx(*new)
+        self._count(affected, 1)
+
+        for r in {pos // self.per_round for pos in changes}:
+            self._check_round(r)
+
+    # --- Edits ---
+
+    def _position(self, match_id: str) -> int:
+        try:
+            return self.match_ids.index(match_id)
+        except ValueError:
+            raise ValueError(f"Unknown match {match_id}")
+
+    def _player(self, player_id: str) -> int:
+        idx = self.scheduler.index.get(player_id)
+        if idx is None:
+            raise ValueError(f"Unknown player {player_id}")
+        return idx
+
+    def swap_players(self, match_a: str, player_a: str, match_b: str, player_b: str):
+        """Swaps player_a (in match_a) with player_b (in match_b); the matches may be the same."""
+        pos_a, pos_b = self._position(match_a), self._position(match_b)
+        a, b = self._player(player_a), self._player(player_b)
+        if a not in self.matches[pos_a] or b not in self.matches[pos_b]:
+            raise ValueError("Player is not in that match")
+
+        if pos_a == pos_b:
+            new = tuple(b if p == a else a if p == b else p for p in self.matches[pos_a])
+            self._replace({pos_a: new})
+        else:
+            new_a = tuple(b if p == a else p for p in self.matches[pos_a])
+            new_b = tuple(a if p == b else p for p in self.matches[pos_b])
+            self._replace({pos_a: new_a, pos_b: new_b})
+
+    def replace_player(self, match_id: str, player_out: str, player_in: str):
+        """Puts player_in (e.g. someone sitting out) in player_out's slot."""
+        pos = self._position(match_id)
+        out, new_player = self._player(player_out), self._player(player_in)
+        if out not in self.matches[pos]:
+            raise ValueError("Player is not in that match")
+        self._replace({pos: tuple(new_player if p == out else p for p in self.matches[pos])})
+
+    def move_match(self, match_id: str, to_index: int):
+        """Reorders a match. Pairings are unchanged, so only round conflicts move."""
+        pos = self._position(match_id)
+        to_index = max(0, min(int(to_index), len(self.matches) - 1))
+        if pos == to_index:
+            return
+        self.matches.insert(to_index, self.matches.pop(pos))
+        self.match_ids.insert(to_index, self.match_ids.pop(pos))
+        for r in range(min(pos, to_index) // self.per_round, max(pos, to_index) // self.per_round + 1):
+            self._check_round(r)
+
+    def apply_edit(self, edit: Dict):
+        kind = edit.get('type')
+        if kind == 'swap':
+            self.swap_players(edit.get('matchA'), edit.get('playerA'), edit.get('matchB'), edit.get('playerB'))
+        elif kind == 'replace':
+            self.replace_player(edit.get('matchId'), edit.get('playerOut'), edit.get('playerIn'))
+        elif kind == 'move':
+            self.move_match(edit.get('matchId'), edit.get('toIndex', 0))
+        else:
+            raise ValueError(f"Unknown edit type {kind}")
+
+    # --- Results ---
+
+    def score(self) -> Dict:
+        breakdown = {name: round(value, 3) for name, value in self.breakdown.items()}
+        breakdown['total'] = round(self.evaluator.total, 3)
+        return breakdown
+
+    def conflicts(self) -> Dict:
+        ids = self.ids
+        return {
+            'repeatPartners': [
+                {'players': [ids[i], ids[j]], 'count': c} for (i, j), c in sorted(self.repeat_partners.items())
+            ],
+            'repeatOpponents': [
+                {'players': [ids[i], ids[j]], 'count': c} for (i, j), c in sorted(self.repeat_opponents.items())
+            ],
+            'doubleBookings': [
+                {'round': r + 1, 'players': [ids[p] for p in players]}
+                for r, players in sorted(self.double_bookings.items())
+            ]
+        }
+
+    def to_matches(self) -> List[Dict]:
+        ids = self.ids
+        return [
+            {'id': match_id, 'team1': [ids[a], ids[b]], 'team2': [ids[c], ids[d]]}
+            for match_id, (a, b, c, d) in zip(self.match_ids, self.matches)
+        ]
+
+class WhatIfStore:
+    """LRU of open scoring sessions, keyed by an opaque token."""
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def open(self, session: WhatIfSession) -> str:
+        token = str(uuid.uuid4())
+        self._sessions[token] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token: Optional[str]) -> Optional[WhatIfSession]:
+        session = self._sessions.get(token) if token else None
+        if session is not None:
+            self._sessions.move_to_end(token)
+        return session
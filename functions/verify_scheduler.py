@@ -1,4 +1,4 @@
-from tools.scheduler import generate_matches
+from tools.scheduler import generate_matches, partition_pods, Scheduler, MODES
 import random
 import time
 
@@ -60,5 +60,59 @@ def verify():
         for i, m in enumerate(matches[:4]):
             print(f"  Match {i+1}: {m['team1']} vs {m['team2']}")
 
+def verify_batch_scoring():
+    # Vectorized batch scoring must agree with the scalar evaluator
+    print("\nChecking batch scoring parity...")
+    failures = []
+    for mode in MODES:
+        for n, games in [(4, 1), (8, 3), (12, 4), (17, 5), (24, 6)]:
+            players = [{"id": f"player_{i}", "hiddenRating": 35.0 + random.uniform(-5, 5)} for i in range(n)]
+            scheduler = Scheduler(players, games_per_player=games, mode=mode)
+            schedules = [scheduler._generate_single_schedule() for _ in range(20)]
+            schedules.append(schedules[0][:len(schedules[0]) // 2]) # Ragged batch
+
+            batch = scheduler.score_schedules(schedules)
+            for schedule, score in zip(schedules, batch):
+                expected = scheduler._evaluate_schedule(schedule)
+                if abs(score - expected) > 1e-6 * max(1.0, abs(expected)):
+                    failures.append(f"{mode} n={n} games={games}: batch {score} != scalar {expected}")
+
+    if failures:
+        print("❌ BATCH SCORING PARITY FAILED:")
+        for f in failures[:10]:
+            print(f"  - {f}")
+    else:
+        print("✅ Batch scoring matches scalar scoring.")
+
+def verify_pods():
+    # The offset phase must move every pod boundary, down to exactly two pods
+    print("\nChecking rating pod partitions...")
+    failures = []
+    for n, pod_size in [(32, 16), (40, 16), (48, 16), (64, 16), (100, 16), (8, 8), (10, 8), (24, 16)]:
+        players = [{"id": f"player_{i}", "hiddenRating": 50.0 - i * 0.1} for i in range(n)]
+        phases = [partition_pods(players, pod_size), partition_pods(players, pod_size, offset=True)]
+        for offset, pods in enumerate(phases):
+            seated = [p["id"] for pod in pods for p in pod]
+            if sorted(seated) != sorted(p["id"] for p in players):
+                failures.append(f"n={n} offset={bool(offset)}: pods do not cover the roster exactly once")
+            if any(len(pod) < 4 for pod in pods):
+                failures.append(f"n={n} offset={bool(offset)}: pod smaller than 4 ({[len(pod) for pod in pods]})")
+
+        first_bounds = {len(p) for p in [[q for pod in phases[0][:i] for q in pod] for i in range(1, len(phases[0]))]}
+        offset_bounds = {len(p) for p in [[q for pod in phases[1][:i] for q in pod] for i in range(1, len(phases[1]))]}
+        if len(phases[0]) >= 2 and (len(phases[1]) < 2 or first_bounds & offset_bounds):
+            failures.append(
+                f"n={n}: offset pods {[len(pod) for pod in phases[1]]} do not move the boundaries of {[len(pod) for pod in phases[0]]}"
+            )
+
+    if failures:
+        print("❌ POD PARTITION CHECK FAILED:")
+        for f in failures:
+            print(f"  - {f}")
+    else:
+        print("✅ Offset pods move every boundary (including two-pod rosters).")
+
 if __name__ == "__main__":
     verify()
+    verify_batch_scoring()
+    verify_pods()
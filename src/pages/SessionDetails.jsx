@@ -5,7 +5,6 @@ import { db } from '../firebase';
 import { generateMatches } from '../utils/matchGenerator'; // DEPRECATED - Keeping for reference/offline fallback if needed
 // import { generateMatches } from '../utils/matchGenerator'; 
 import { getFunctions, httpsCallable } from 'firebase/functions';
-import { calculateSpread } from '../services/Oddsmaker';
 import { validateSchedule } from '../utils/scheduleValidator';
 import { useAuth } from '../contexts/AuthContext';
 import { useClub } from '../contexts/ClubContext';
@@ -126,27 +125,22 @@ const SessionDetails = () => {
             const functions = getFunctions();
             const generateSchedule = httpsCallable(functions, 'generate_schedule');
 
-            // Call Cloud Function
+            // Call Cloud Function (it reads the ratings and saves the priced matches itself)
             const result = await generateSchedule({
-                players: players,
+                sessionId,
+                players: players.map(p => ({ id: p.id })),
                 gamesPerPlayer: session.gamesPerPlayer || 4,
                 mode: matchmakingMode
             });
+            if (result.data.error) throw new Error(result.data.error);
 
-            let newMatches = result.data.matches;
+            // Matches come back priced (spread, favoriteTeam) by the server
+            const newMatches = result.data.matches;
 
             if (!newMatches || !Array.isArray(newMatches)) {
                 throw new Error("Invalid response from server");
             }
 
-            // Calculate Spreads for each match (Client-Side)
-            newMatches = newMatches.map(match => {
-                const team1Players = players.filter(p => match.team1.includes(p.id));
-                const team2Players = players.filter(p => match.team2.includes(p.id));
-                const { spread, favoriteTeam } = calculateSpread(team1Players, team2Players);
-                return { ...match, spread, favoriteTeam };
-            });
-
             setMatches(newMatches);
 
             // Validation Step
@@ -154,14 +148,8 @@ const SessionDetails = () => {
             if (!validation.isValid) {
                 console.error(validation.error);
                 alert("Warning: " + validation.error);
-                // We show alert but still allow saving if server returned it, or maybe return? 
-                // Server should be trusted, but good to know.
+                // The server has already saved it; this only flags a bad schedule.
             }
-
-            // Save to Firestore
-            await updateDoc(doc(db, 'sessions', sessionId), {
-                matches: newMatches
-            });
         } catch (error) {
             console.error("Error generating matches:", error);
             alert("Error generating matches: " + error.message);
@@ -172,20 +160,16 @@ const SessionDetails = () => {
 
     const handleRecalculateSpreads = async () => {
         if (!session || !matches.length) return;
-        if (!window.confirm("Recalculate spreads for all existing matches based on current player ratings?")) return;
+        if (!window.confirm("Recalculate spreads for all unplayed matches based on current player ratings?")) return;
 
         setLoading(true);
         try {
-            const updatedMatches = matches.map(match => {
-                const team1Players = players.filter(p => match.team1.includes(p.id));
-                const team2Players = players.filter(p => match.team2.includes(p.id));
-                const { spread, favoriteTeam } = calculateSpread(team1Players, team2Players);
-                return { ...match, spread, favoriteTeam };
-            });
+            const functions = getFunctions();
+            const recalculateSpreads = httpsCallable(functions, 'recalculate_spreads');
+            const result = await recalculateSpreads({ sessionId });
+            if (result.data.error) throw new Error(result.data.error);
 
-            await updateDoc(doc(db, 'sessions', sessionId), {
-                matches: updatedMatches
-            });
+            const updatedMatches = result.data.matches;
             // Update local state immediately to reflect changes
             setMatches(updatedMatches);
             alert("Spreads recalculated successfully.");